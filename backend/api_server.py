@@ -1,13 +1,21 @@
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import uvicorn
+import asyncio
 import time
 import atexit
 import json
+from typing import Optional
 
 from music_player_logic import MusicPlayerLogic
 from performance_logger import perf_logger
+from format_selector import POLICIES as FORMAT_POLICIES
+from preload_scheduler import PRIORITY_NEXT, PRIORITY_QUEUE, PRIORITY_BACKGROUND
+from player_state import PlayerStateTracker
+from response_cache import ResponseCache, etag_matches
+from job_manager import JobManager
 
 app = FastAPI(title="Music Player API")
 
@@ -38,9 +46,18 @@ class AddSongRequest(BaseModel):
     playlist_id: str | None = None
     playlist_name: str | None = None
 
+class BatchAddRequest(BaseModel):
+    urls: list[str]  # Song and/or playlist URLs
+    playlist_id: str | None = None
+    playlist_name: str | None = None  # Creates a new playlist when playlist_id is not given
+
 class RefreshPlaylistRequest(BaseModel):
     playlist_id: str
 
+class FormatPolicyRequest(BaseModel):
+    policy: str
+    min_bitrate: float | None = None  # kbps floor for "lowest_adequate"
+
 class HeadlessUI:
     def __init__(self):
         self.current_song = None
@@ -101,85 +118,244 @@ class ConnectionManager:
         self.active_connections.append(websocket)
     
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        if websocket in self.active_connections:
+            self.active_connections.remove(websocket)
     
     async def send_progress(self, message: dict):
-        for connection in self.active_connections:
+        await self.broadcast(message)
+
+    async def broadcast(self, message: dict):
+        text = json.dumps(message)
+        for connection in list(self.active_connections):
             try:
-                await connection.send_text(json.dumps(message))
-            except:
-                pass
+                await connection.send_text(text)
+            except Exception:
+                self.disconnect(connection)
 
 manager = ConnectionManager()
 
+# Player state is sampled once per tick for all clients and pushed as deltas
+STATE_TICK_SECONDS = 0.25
+player_state = PlayerStateTracker(position_interval=1.0)
+_track_length = {"song": None, "ms": 0}
+
+def _current_track_length(song):
+    """libvlc only knows the length once playback starts; ask until it does, then reuse it."""
+    song_id = (song or {}).get("id")
+    if song_id != _track_length["song"] or not _track_length["ms"]:
+        _track_length["song"] = song_id
+        _track_length["ms"] = logic.music_player.get_length() if logic.music_player else 0
+    return _track_length["ms"]
+
+def collect_player_state():
+    """Sample the current player state."""
+    player = logic.music_player
+    is_playing = player.is_playing if player else False
+    return {
+        "current_song": ui_handler.current_song,
+        "is_playing": is_playing,
+        "is_paused": player.is_paused if player else False,
+        "volume": ui_handler.volume,
+        "position": player.get_pos() if is_playing else 0,
+        "duration": _current_track_length(ui_handler.current_song) if player else 0,
+        "current_playlist_id": logic.current_playlist_id,
+        "current_song_index": logic.current_song_index,
+        "is_muted": ui_handler.is_muted,
+        "is_shuffled": logic.playback_controller.is_shuffled,
+        "is_repeated": logic.playback_controller.is_repeated
+    }
+
+async def push_player_state():
+    """Sample the player and broadcast what changed since the last sample."""
+    changes = player_state.update(collect_player_state())
+    if changes:
+        await manager.broadcast({
+            "type": "state",
+            "version": player_state.version,
+            "base_version": player_state.version - 1,
+            "changes": changes
+        })
+
+async def player_state_loop():
+    while True:
+        await asyncio.sleep(STATE_TICK_SECONDS)
+        if not manager.active_connections:
+            continue  # Nobody listening; don't touch libvlc
+        try:
+            await push_player_state()
+        except Exception as e:
+            print(f"Error pushing player state: {e}")
+
+@app.on_event("startup")
+async def start_player_state_loop():
+    asyncio.create_task(player_state_loop())
+
+# Playlist imports and refreshes run as background jobs; their progress is
+# forwarded to /ws from the worker threads through the server's event loop
+_event_loop = {"loop": None}
+
+def publish_job_update(job, message):
+    loop = _event_loop["loop"]
+    if loop is None or not manager.active_connections:
+        return
+    if message and message.get("type"):
+        payload = dict(message, job_id=job.id)
+    else:
+        payload = {"type": "job", "job": job.to_dict()}
+    asyncio.run_coroutine_threadsafe(manager.broadcast(payload), loop)
+
+jobs = JobManager(max_workers=2, on_update=publish_job_update)
+
+@app.on_event("startup")
+async def capture_event_loop():
+    _event_loop["loop"] = asyncio.get_running_loop()
+
+def start_playlist_import(url, kind="import"):
+    """Queue an import/sync of `url`, or return the job already running for it."""
+    def run(job):
+        start_time = time.time()
+        result = logic.youtube_controller.import_playlist(url, job)
+        if kind == "refresh":
+            perf_logger.log_playlist_refresh(
+                result["playlist_id"], result["added"], result["removed"],
+                result["total_songs"], time.time() - start_time
+            )
+        return result
+    return jobs.submit(kind, url.strip(), run)
+
+async def send_player_state(websocket: WebSocket, since_version=None):
+    """Bring one client up to date: the missed changes if still known, else a full snapshot."""
+    changes = player_state.changes_since(since_version) if isinstance(since_version, int) else None
+    if changes is None:
+        version, state = player_state.snapshot()
+        await websocket.send_text(json.dumps({"type": "snapshot", "version": version, "state": state}))
+    else:
+        await websocket.send_text(json.dumps({
+            "type": "state",
+            "version": player_state.version,
+            "base_version": since_version,
+            "changes": changes
+        }))
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
     try:
         while True:
-            await websocket.receive_text()
+            text = await websocket.receive_text()
+            try:
+                message = json.loads(text)
+            except ValueError:
+                continue
+            if isinstance(message, dict) and message.get("type") == "resync":
+                if not player_state.version:
+                    player_state.update(collect_player_state())
+                await send_player_state(websocket, message.get("since_version"))
     except WebSocketDisconnect:
         manager.disconnect(websocket)
 
+# Serialized library responses, rebuilt only when PlaylistManager versions move
+response_cache = ResponseCache()
+
+def cached_json_response(request: Request, key, version, build):
+    """
+    Serve the cached body of `key` at `version` (building it from `build()`
+    on a miss): 304 if the client already has it, gzipped if accepted. A
+    304 is answered from the ETag alone, without building anything.
+    """
+    etag = response_cache.etag(key, version)
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        response_cache.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    entry = response_cache.get(key, version, build)
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return Response(entry.gzipped(), media_type="application/json", headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
 @app.get("/")
 async def root():
     return {"message": "Music Player API Server"}
 
 @app.get("/api/status")
 async def get_status():
-    """Get current player status"""
-    # Get real-time position and duration from music player
-    position = logic.music_player.get_pos() if logic.music_player else 0
-    duration = logic.music_player.get_length() if logic.music_player else 0
-    is_playing = logic.music_player.is_playing if logic.music_player else False
-    is_paused = logic.music_player.is_paused if logic.music_player else False
-    
-    return {
-        "current_song": ui_handler.current_song,
-        "is_playing": is_playing,
-        "is_paused": is_paused,
-        "volume": ui_handler.volume,
-        "position": position,
-        "duration": duration,
-        "current_playlist_id": logic.current_playlist_id,
-        "current_song_index": logic.current_song_index,
-        "is_muted": ui_handler.is_muted,
-        "is_shuffled": logic.playback_controller.is_shuffled,
-        "is_repeated": logic.playback_controller.is_repeated
-    }
+    """Get current player status (clients on /ws get it pushed instead)"""
+    status = collect_player_state()
+    status["version"] = player_state.version
+    return status
+
+@app.get("/api/status/stats")
+async def get_status_stats():
+    """Get push-update counters and connected client count"""
+    return dict(player_state.get_stats(), clients=len(manager.active_connections))
 
 @app.get("/api/playlists")
-async def get_playlists():
+async def get_playlists(request: Request, offset: int = 0, limit: Optional[int] = None):
+    """
+    Legacy: playlists with every song materialized. Each returned playlist's
+    body is loaded, so without `limit` this costs as much as the whole
+    library; use /api/playlists/summary and /api/playlist/{id}/songs instead.
+    """
+    if offset < 0 or (limit is not None and not 1 <= limit <= 1000):
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and limit between 1 and 1000")
     start_time = time.time()
-    result = {"playlists": logic.playlist_manager.get_all_playlists()}
+    pm = logic.playlist_manager
+
+    def build():
+        playlist_ids = pm.get_playlist_ids()
+        window = playlist_ids[offset:] if limit is None else playlist_ids[offset:offset + limit]
+        playlists = {playlist_id: pm.get_playlist(playlist_id) for playlist_id in window}
+        return {
+            "playlists": {playlist_id: playlist for playlist_id, playlist in playlists.items() if playlist is not None},
+            "total": len(playlist_ids),
+            "offset": offset
+        }
+
+    result = cached_json_response(request, ("playlists", offset, limit), pm.get_library_version(), build)
     perf_logger.log_api_request("/api/playlists", "GET", time.time() - start_time)
     return result
 
+@app.get("/api/playlists/summary")
+async def get_playlist_summaries(request: Request):
+    """List playlists without their songs"""
+    start_time = time.time()
+    pm = logic.playlist_manager
+    result = cached_json_response(request, "summary", pm.get_library_version(),
+                                  lambda: {"playlists": pm.get_playlist_summaries()})
+    perf_logger.log_api_request("/api/playlists/summary", "GET", time.time() - start_time)
+    return result
+
 @app.post("/api/play")
 async def play_song(request: PlayRequest):
     logic.current_playlist_id = request.playlist_id
     logic.play_song_by_index(request.song_index)
+    await push_player_state()
     return {"message": "Playing"}
 
 @app.post("/api/pause")
 async def toggle_pause():
     logic.toggle_play_pause()
+    await push_player_state()
     return {"message": "Toggled"}
 
 @app.post("/api/next")
 async def next_song():
     logic.next_song()
+    await push_player_state()
     return {"message": "Next"}
 
 @app.post("/api/previous")
 async def previous_song():
     logic.prev_song()
+    await push_player_state()
     return {"message": "Previous"}
 
 @app.post("/api/volume")
 async def set_volume(request: VolumeRequest):
     logic.set_volume(request.volume)
     ui_handler.volume = request.volume
+    await push_player_state()
     return {"message": "Volume set"}
 
 @app.post("/api/seek")
@@ -188,88 +364,65 @@ async def seek_position(request: SeekRequest):
     if logic.music_player and logic.music_player.is_playing:
         logic.music_player.set_pos(int(request.position * 1000))
         print(f"Seeked to: {request.position} seconds")
+    await push_player_state()
     return {"message": "Seeked"}
 
 @app.post("/api/playlist/add")
 async def add_playlist(request: PlaylistRequest):
-    import threading
-    import time
-    
     # Check if playlist already exists by URL
     existing_playlist_id = logic.playlist_manager.get_playlist_by_url(request.url)
     if existing_playlist_id:
         return {"message": "Playlist already exists", "exists": True}
     
-    # Set progress callback for WebSocket updates
-    logic.youtube_controller.progress_callback = manager.send_progress
-    
-    # Start the add process
-    logic.add_from_link(request.url)
-    
-    return {"message": "Processing started", "exists": False}
+    job, created = start_playlist_import(request.url)
+    return {
+        "message": "Processing started" if created else "Already processing",
+        "exists": False,
+        "job_id": job.id,
+        "status": job.status
+    }
 
 @app.post("/api/playlist/{playlist_id}/refresh")
 async def refresh_playlist(playlist_id: str):
-    """Refresh an existing playlist from its YouTube source"""
-    import threading
-    import time
-    
-    start_time = time.time()
-    
-    if playlist_id not in logic.playlist_manager.playlists:
+    """Start refreshing an existing playlist from its YouTube source; progress arrives on /ws"""
+    if not logic.playlist_manager.has_playlist(playlist_id):
         raise HTTPException(status_code=404, detail="Playlist not found")
     
-    playlist = logic.playlist_manager.playlists[playlist_id]
-    source_url = playlist.get("source_url")
+    source_url = logic.playlist_manager.get_playlist_url(playlist_id)
     
     if not source_url:
         raise HTTPException(status_code=400, detail="Playlist has no source URL to refresh from")
     
-    # Store original song count
-    original_songs = len(playlist.get("songs", []))
-    
-    # Create event to wait for completion
-    refresh_complete = threading.Event()
-    result_data = {"added": 0, "removed": 0}
-    
-    # Override the update method to capture results
-    original_update_method = logic.youtube_controller._update_ui_after_playlist_sync
-    
-    def capture_results(pid, pname, added_ids, removed_ids):
-        if pid == playlist_id:
-            result_data["added"] = len(added_ids)
-            result_data["removed"] = len(removed_ids)
-            refresh_complete.set()
-        original_update_method(pid, pname, added_ids, removed_ids)
-    
-    logic.youtube_controller._update_ui_after_playlist_sync = capture_results
-    
-    try:
-        # Start the refresh
-        logic.add_from_link(source_url)
-        
-        # Wait for completion (max 30 seconds)
-        if refresh_complete.wait(timeout=30):
-            refresh_time = time.time() - start_time
-            total_songs = len(logic.playlist_manager.playlists[playlist_id].get("songs", []))
-            
-            perf_logger.log_playlist_refresh(
-                playlist_id, result_data["added"], result_data["removed"], 
-                total_songs, refresh_time
-            )
-            perf_logger.log_api_request(f"/api/playlist/{playlist_id}/refresh", "POST", refresh_time)
-            
-            return {
-                "message": "Refresh completed",
-                "added": result_data["added"],
-                "removed": result_data["removed"],
-                "total_songs": total_songs
-            }
-        else:
-            raise HTTPException(status_code=408, detail="Refresh operation timed out")
-    finally:
-        # Restore original method
-        logic.youtube_controller._update_ui_after_playlist_sync = original_update_method
+    job, created = start_playlist_import(source_url, kind="refresh")
+    return {
+        "message": "Refresh started" if created else "Already refreshing",
+        "job_id": job.id,
+        "status": job.status
+    }
+
+@app.get("/api/jobs")
+async def list_jobs(active: bool = False):
+    """List recent background jobs, newest first"""
+    return {
+        "jobs": [job.to_dict() for job in reversed(jobs.list_jobs(active_only=active))],
+        "stats": jobs.get_stats()
+    }
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get a background job's status, progress and result"""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job; fetches already in flight finish first"""
+    job = jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
 @app.post("/api/song/check")
 async def check_song_exists(request: AddSongRequest):
@@ -289,8 +442,7 @@ async def check_song_exists(request: AddSongRequest):
     print(f"Video ID: {video_id}")
     
     if request.playlist_id:
-        existing_songs = logic.playlist_manager.get_songs(request.playlist_id)
-        if any(song.get('id') == video_id for song in existing_songs):
+        if logic.playlist_manager.song_exists(request.playlist_id, video_id):
             print("Song already exists")
             return {"exists": True, "message": "Song already exists in playlist"}
     
@@ -299,17 +451,16 @@ async def check_song_exists(request: AddSongRequest):
 
 @app.post("/api/song/add")
 async def add_song(request: AddSongRequest):
-    from youtube_streamer import YouTubeStreamer
-    
     print(f"Adding song: {request.url}")
     
     if "list=" in request.url:
         raise HTTPException(status_code=400, detail="Use /api/playlist/add for playlist URLs")
     
     try:
-        yt_streamer = YouTubeStreamer(None, None)
+        # Shared streamer, so the stream URL resolved here is reused on play
+        yt_streamer = logic.youtube_controller.yt_streamer
         print("Fetching song info...")
-        song_info = yt_streamer.fetch_full_song_info(request.url)
+        song_info = await yt_streamer.fetch_full_song_info_async(request.url)
         print(f"Song info fetched: {song_info}")
         
         if not song_info:
@@ -328,17 +479,161 @@ async def add_song(request: AddSongRequest):
             print(f"Creating new playlist: {request.playlist_name}")
             playlist_id = logic.create_new_playlist_with_song(request.playlist_name, song_info)
             return {"message": "New playlist created with song", "playlist_id": playlist_id}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in add_song: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+BATCH_MAX_URLS = 200
+BATCH_CONCURRENCY = 2  # Resolves one batch may run at once; leaves room on the shared pool for /api/song/add
+
+async def resolve_batch_item(index, url, limit):
+    """
+    Resolve one URL of a batch, running at most `limit` (a semaphore shared
+    by the batch) extractions at a time; returns (result line, songs in
+    playlist order). Songs that could not be resolved are left out rather
+    than stored as placeholders.
+    """
+    yt_streamer = logic.youtube_controller.yt_streamer
+    line = {"type": "item", "index": index, "url": url}
+
+    async def fetch_song(song_url):
+        async with limit:
+            return await yt_streamer.fetch_full_song_info_async(song_url, fallback=False)
+
+    try:
+        if "list=" in url:
+            async with limit:
+                info = await yt_streamer.fetch_playlist_info_async(url)
+            entries = info.get("entries", [])
+            songs = await asyncio.gather(*(fetch_song(entry["url"]) for entry in entries))
+            songs = [song for song in songs if song]
+            if entries and not songs:
+                line.update(status="error", kind="playlist", error="Could not fetch any song of the playlist")
+                return line, []
+            line.update(status="ok", kind="playlist", title=info.get("title"),
+                        songs=len(songs), failed=len(entries) - len(songs))
+            return line, songs
+        song = await fetch_song(url)
+        if not song:
+            line.update(status="error", error="Could not fetch song information")
+            return line, []
+        line.update(status="ok", kind="song", song=song)
+        return line, [song]
+    except Exception as e:
+        print(f"Error resolving batch item {url}: {e}")
+        line.update(status="error", error=str(e))
+        return line, []
+
+@app.post("/api/songs/batch")
+async def add_songs_batch(request: BatchAddRequest):
+    """
+    Resolve many song/playlist URLs concurrently (at most BATCH_CONCURRENCY
+    extractions at a time) and add the songs to one playlist as a single change.
+    Streams NDJSON: an `item` line per URL as it resolves, then a `done`
+    line once the batch is applied. Disconnecting early abandons the batch.
+    """
+    urls = [url.strip() for url in request.urls if url.strip()]
+    if not 1 <= len(urls) <= BATCH_MAX_URLS:
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {BATCH_MAX_URLS} URLs")
+    if request.playlist_id:
+        if not logic.playlist_manager.has_playlist(request.playlist_id):
+            raise HTTPException(status_code=404, detail="Playlist not found")
+    elif not request.playlist_name:
+        raise HTTPException(status_code=400, detail="Playlist name required for new playlist")
+
+    async def stream():
+        start_time = time.time()
+        resolved = [[] for _ in urls]
+        failed = 0
+        limit = asyncio.Semaphore(BATCH_CONCURRENCY)
+        tasks = [asyncio.ensure_future(resolve_batch_item(i, url, limit)) for i, url in enumerate(urls)]
+        try:
+            for next_item in asyncio.as_completed(tasks):
+                line, songs = await next_item
+                resolved[line["index"]] = songs
+                failed += line["status"] != "ok"
+                yield json.dumps(line) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        # One song per video, in the order the URLs were given
+        songs = list({song.get("id") or song.get("url"): song for batch in resolved for song in batch}.values())
+        done = {"type": "done", "resolved": len(urls) - failed, "failed": failed}
+        try:
+            if request.playlist_id:
+                added_ids = logic.add_songs_to_playlist(request.playlist_id, songs)
+                if added_ids is None:
+                    raise ValueError("Playlist was deleted")
+                done.update(playlist_id=request.playlist_id, added=len(added_ids))
+            elif songs:
+                playlist_id = logic.create_new_playlist_with_songs(request.playlist_name, songs)
+                done.update(playlist_id=playlist_id, added=len(songs))
+            else:
+                done.update(playlist_id=None, added=0)
+        except Exception as e:
+            print(f"Error applying song batch: {e}")
+            done["error"] = str(e)
+        perf_logger.log_api_request("/api/songs/batch", "POST", time.time() - start_time)
+        yield json.dumps(done) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 @app.get("/api/playlist/{playlist_id}/songs")
-async def get_playlist_songs(playlist_id: str):
-    return {"songs": logic.playlist_manager.get_songs(playlist_id)}
+async def get_playlist_songs(request: Request, playlist_id: str, offset: int = 0, limit: Optional[int] = None,
+                             cursor: Optional[str] = None):
+    """
+    Get a window of a playlist's songs. Without `limit` every song is
+    returned; `cursor` is the `next_cursor` of a previous page and takes
+    precedence over `offset`. A cursor is tied to the playlist version it
+    was issued for: if the playlist changed since, 409 is returned and the
+    client should restart from the first page.
+    """
+    version = logic.playlist_manager.get_playlist_version(playlist_id)
+    if cursor is not None:
+        cursor_version, _, cursor_offset = cursor.partition(":")
+        if not cursor_version.isdigit() or not cursor_offset.isdigit():
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if version is None or int(cursor_version) != version:
+            raise HTTPException(status_code=409, detail="Playlist changed; restart from the first page")
+        offset = int(cursor_offset)
+    if offset < 0 or (limit is not None and not 1 <= limit <= 1000):
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and limit between 1 and 1000")
+
+    def build_page():
+        songs, total = logic.playlist_manager.get_songs_page(playlist_id, offset, limit)
+        next_offset = offset + len(songs)
+        return {
+            "songs": songs,
+            "total": total,
+            "offset": offset,
+            # Stamped with the version read before the page was built, so a
+            # concurrent change makes the next page 409 rather than drift
+            "next_cursor": f"{version}:{next_offset}" if next_offset < total else None
+        }
+
+    if version is None:
+        return build_page()  # Unknown playlist: an empty page, not worth caching
+    return cached_json_response(request, ("songs", playlist_id, offset, limit), version, build_page)
+
+@app.get("/api/search")
+async def search_songs(q: str, offset: int = 0, limit: int = 50, playlist_id: Optional[str] = None):
+    """Search song titles across the library (or one playlist), best matches first"""
+    if offset < 0 or not 1 <= limit <= 1000:
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and limit between 1 and 1000")
+    start_time = time.time()
+    pm = logic.playlist_manager
+    songs, total = pm.search_songs(q, playlist_id=playlist_id, offset=offset, limit=limit)
+    results = [dict(song, playlist_ids=pm.get_playlists_with_song(song.get("id"))) for song in songs]
+    perf_logger.log_api_request("/api/search", "GET", time.time() - start_time)
+    return {"results": results, "total": total, "offset": offset}
 
 @app.post("/api/shuffle")
 async def toggle_shuffle():
     logic.toggle_shuffle()
+    await push_player_state()
     return {
         "message": "Shuffle toggled",
         "is_shuffled": logic.playback_controller.is_shuffled,
@@ -348,6 +643,7 @@ async def toggle_shuffle():
 @app.post("/api/repeat")
 async def toggle_repeat():
     logic.toggle_repeat()
+    await push_player_state()
     return {
         "message": "Repeat toggled",
         "is_shuffled": logic.playback_controller.is_shuffled,
@@ -367,8 +663,30 @@ async def toggle_mute():
         logic.set_volume(0)
         ui_handler.volume = 0
         ui_handler.is_muted = True
+    await push_player_state()
     return {"message": "Mute toggled", "is_muted": ui_handler.is_muted}
 
+# Songs around the selected (or playing) index that are warmed ahead of the
+# rest of the playlist, which is queued at background priority
+PRELOAD_WINDOW_BEFORE = 2
+PRELOAD_WINDOW_AFTER = 10
+
+def schedule_playlist_preload(song_ids, index, group, first_priority=PRIORITY_NEXT):
+    """
+    Queue URL resolution for a playlist: the song at `index` at
+    `first_priority`, its neighbours at PRIORITY_QUEUE, and every other song
+    at PRIORITY_BACKGROUND, all in `group`. Returns the near-window IDs.
+    """
+    index = min(max(index, 0), len(song_ids) - 1)
+    start, end = max(0, index - PRELOAD_WINDOW_BEFORE), index + PRELOAD_WINDOW_AFTER + 1
+    near = song_ids[index + 1:end] + song_ids[start:index]
+    rest = song_ids[end:] + song_ids[:start]
+    yt_streamer = logic.youtube_controller.yt_streamer
+    yt_streamer.preload_song_urls(song_ids[index:index + 1], first_priority, group=group)
+    yt_streamer.preload_song_urls(near, PRIORITY_QUEUE, group=group)
+    yt_streamer.preload_song_urls(rest, PRIORITY_BACKGROUND, group=group)
+    return song_ids[start:end]
+
 @app.post("/api/playlist/load")
 async def load_playlist(request: PlayRequest):
     """Load playlist without starting playback or updating now playing"""
@@ -377,45 +695,57 @@ async def load_playlist(request: PlayRequest):
     logic.current_playlist_id = request.playlist_id
     logic.current_song_index = request.song_index
     
-    # Preload first few songs in background
-    songs = logic.playlist_manager.get_songs(request.playlist_id)
+    # Preload around the selected song, then the rest of the playlist in the background
+    song_ids = [video_id for video_id in logic.playlist_manager.get_song_ids(request.playlist_id) if video_id]
     cached_songs = 0
     
-    if songs:
-        video_ids = [song.get('id') for song in songs[:5] if song.get('id')]
-        if video_ids:
-            # Count cached songs
-            for video_id in video_ids:
-                if video_id in logic.youtube_controller.yt_streamer.url_cache:
-                    cached_songs += 1
-            
-            logic.youtube_controller.yt_streamer.preload_song_urls(video_ids)
+    if song_ids:
+        # A newly loaded playlist makes the previous playlist's preloads irrelevant
+        yt_streamer = logic.youtube_controller.yt_streamer
+        yt_streamer.preload_scheduler.cancel_group("playlist")
+        yt_streamer.preload_scheduler.cancel_group("playlist-preload")
+        window = schedule_playlist_preload(song_ids, request.song_index, "playlist")
+        cached_songs = sum(1 for video_id in window if yt_streamer.has_valid_url(video_id))
     
     load_time = time.time() - start_time
-    perf_logger.log_playlist_load(request.playlist_id, len(songs), load_time, cached_songs)
+    perf_logger.log_playlist_load(request.playlist_id, len(song_ids), load_time, cached_songs)
     perf_logger.log_api_request("/api/playlist/load", "POST", load_time)
     
     return {"message": "Playlist loaded"}
 
 @app.post("/api/playlist/preload")
 async def preload_playlist(request: PlayRequest):
-    """Preload URLs for playlist songs"""
-    songs = logic.playlist_manager.get_songs(request.playlist_id)
-    if songs:
-        video_ids = [song.get('id') for song in songs if song.get('id')]
-        if video_ids:
-            logic.youtube_controller.yt_streamer.preload_song_urls(video_ids)
+    """Preload URLs around the selected or playing index, then the rest of the playlist"""
+    song_ids = [video_id for video_id in logic.playlist_manager.get_song_ids(request.playlist_id) if video_id]
+    if song_ids:
+        index = request.song_index
+        if logic.current_playlist_id == request.playlist_id and logic.music_player and logic.music_player.is_playing:
+            index = logic.current_song_index
+        # Supersedes earlier preload requests only; jobs queued by a load or
+        # play keep their group, and requeuing them never lowers their priority
+        yt_streamer = logic.youtube_controller.yt_streamer
+        yt_streamer.preload_scheduler.cancel_group("playlist-preload")
+        schedule_playlist_preload(song_ids, index, "playlist-preload", first_priority=PRIORITY_QUEUE)
     return {"message": "Preloading started"}
 
+@app.get("/api/preload/stats")
+async def get_preload_stats():
+    """Get preload queue depth, lag and counters"""
+    yt_streamer = logic.youtube_controller.yt_streamer
+    stats = yt_streamer.preload_scheduler.get_stats()
+    stats["refresher"] = yt_streamer.url_refresher.get_stats()
+    return stats
+
 @app.post("/api/stop")
 async def stop_playback():
     logic.stop_and_cleanup()
+    await push_player_state()
     return {"message": "Stopped"}
 
 @app.delete("/api/playlist/{playlist_id}")
 async def delete_playlist(playlist_id: str):
     """Delete a playlist"""
-    if playlist_id not in logic.playlist_manager.playlists:
+    if not logic.playlist_manager.has_playlist(playlist_id):
         raise HTTPException(status_code=404, detail="Playlist not found")
     
     logic.playlist_manager.remove_playlist(playlist_id)
@@ -424,66 +754,18 @@ async def delete_playlist(playlist_id: str):
 @app.get("/api/cache/stats")
 async def get_cache_stats():
     """Get cache statistics"""
-    import os
-    import json
-    
-    url_cache_count = 0
-    metadata_cache_count = 0
-    
-    # Count URL cache entries
-    url_cache_file = "song_url_cache.json"
-    if os.path.exists(url_cache_file):
-        try:
-            with open(url_cache_file, 'r', encoding='utf-8') as f:
-                url_cache = json.load(f)
-                url_cache_count = len(url_cache)
-        except Exception as e:
-            print(f"Error reading URL cache: {e}")
-    
-    # Count metadata cache entries
-    metadata_cache_file = "song_metadata_cache.json"
-    if os.path.exists(metadata_cache_file):
-        try:
-            with open(metadata_cache_file, 'r', encoding='utf-8') as f:
-                metadata_cache = json.load(f)
-                metadata_cache_count = len(metadata_cache)
-        except Exception as e:
-            print(f"Error reading metadata cache: {e}")
-    
-    return {
-        "url_cache_count": url_cache_count,
-        "metadata_cache_count": metadata_cache_count
-    }
+    stats = logic.youtube_controller.yt_streamer.get_cache_stats()
+    stats["responses"] = response_cache.get_stats()
+    return stats
 
 @app.post("/api/cache/clear")
 async def clear_cache():
-    """Clear all cache files"""
-    import os
-    
-    files_cleared = []
-    
+    """Clear URL, metadata and audio caches"""
     try:
-        # Clear URL cache
-        url_cache_file = "song_url_cache.json"
-        if os.path.exists(url_cache_file):
-            os.remove(url_cache_file)
-            files_cleared.append("URL cache")
-        
-        # Clear metadata cache
-        metadata_cache_file = "song_metadata_cache.json"
-        if os.path.exists(metadata_cache_file):
-            os.remove(metadata_cache_file)
-            files_cleared.append("Metadata cache")
-        
-        # Clear in-memory caches
-        if hasattr(logic.youtube_controller.yt_streamer, 'url_cache'):
-            logic.youtube_controller.yt_streamer.url_cache.clear()
-        if hasattr(logic.youtube_controller.yt_streamer, 'metadata_cache'):
-            logic.youtube_controller.yt_streamer.metadata_cache.clear()
-        
+        logic.youtube_controller.yt_streamer.clear_cache()
         return {
             "message": "Cache cleared",
-            "cleared": files_cleared
+            "cleared": ["URL cache", "Metadata cache", "Audio cache"]
         }
     except Exception as e:
         print(f"Error clearing cache: {e}")
@@ -492,14 +774,48 @@ async def clear_cache():
             "error": str(e)
         }
 
+@app.get("/api/extractor/stats")
+async def get_extractor_stats():
+    """Get yt-dlp extractor pool and duplicate-extraction statistics"""
+    return logic.youtube_controller.yt_streamer.get_extraction_stats()
+
+@app.get("/api/stream/format-policy")
+async def get_format_policy():
+    """Get the audio format selection policy"""
+    selector = logic.youtube_controller.yt_streamer.format_selector
+    return {
+        "policy": selector.policy,
+        "min_bitrate": selector.min_bitrate,
+        "available": list(FORMAT_POLICIES)
+    }
+
+@app.post("/api/stream/format-policy")
+async def set_format_policy(request: FormatPolicyRequest):
+    """Change the audio format selection policy for newly resolved songs"""
+    selector = logic.youtube_controller.yt_streamer.format_selector
+    try:
+        selector.set_policy(request.policy)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if request.min_bitrate is not None:
+        selector.min_bitrate = request.min_bitrate
+    return {"message": "Format policy set", "policy": selector.policy, "min_bitrate": selector.min_bitrate}
+
 # Register shutdown handler
+def log_cache_stats():
+    stats = logic.youtube_controller.yt_streamer.get_cache_stats()
+    perf_logger.log_cache_stats(stats["url_cache_count"], stats["metadata_cache_count"])
+
 def shutdown_handler():
-    perf_logger.log_cache_stats()
+    jobs.shutdown()
+    log_cache_stats()
+    logic.playlist_manager.close()
     perf_logger.log_app_shutdown()
 
 atexit.register(shutdown_handler)
 
 if __name__ == "__main__":
     print("Starting Music Player API Server...")
-    perf_logger.log_cache_stats()  # Log initial cache state
+    logic.youtube_controller.yt_streamer.purge_expired_cache()
+    log_cache_stats()  # Log initial cache state
     uvicorn.run(app, host="127.0.0.1", port=5001, log_level="info")
\ No newline at end of file
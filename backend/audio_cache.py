@@ -0,0 +1,202 @@
+import os
+import queue
+import re
+import threading
+import time
+import urllib.request
+
+CHUNK_SIZE = 1024 * 1024  # googlevideo throttles large single requests; fetch in ranges
+
+
+class AudioCache:
+    """
+    Size-capped on-disk cache of audio streams keyed by video ID and format.
+    The index lives in the cache store; files are filled after a track has
+    played, by one background download worker, and evicted by least recent
+    ("lru") or least frequent ("lfu") use once the cache exceeds `max_bytes`.
+    """
+
+    NAMESPACE = "audio"
+
+    def __init__(self, cache_store, directory="audio_cache", max_bytes=1024 ** 3, policy="lru"):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown eviction policy '{policy}'")
+        self.cache_store = cache_store
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._worker = None
+        self.metrics = {"hits": 0, "misses": 0, "fills": 0, "fill_errors": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+        self._index = self._load_index()
+
+    def _load_index(self):
+        """Load the index, dropping entries whose file has disappeared."""
+        index = {}
+        for video_id, entry in self.cache_store.items(self.NAMESPACE):
+            if os.path.exists(entry.get("path", "")):
+                index[video_id] = entry
+            else:
+                self.cache_store.delete(self.NAMESPACE, video_id)
+        return index
+
+    def _path_for(self, video_id, format_id):
+        safe_format = re.sub(r'[^A-Za-z0-9_-]', '_', str(format_id or "audio"))
+        return os.path.join(self.directory, f"{video_id}-{safe_format}.audio")
+
+    def lookup(self, video_id):
+        """Return the local file path for a cached track, or None."""
+        with self._lock:
+            entry = self._index.get(video_id)
+            if not entry or not os.path.exists(entry["path"]):
+                if entry:
+                    del self._index[video_id]
+                self.metrics["misses"] += 1
+                return None
+            entry["last_access"] = time.time()
+            entry["hits"] = entry.get("hits", 0) + 1
+            self.metrics["hits"] += 1
+        self.cache_store.put(self.NAMESPACE, video_id, entry)
+        return entry["path"]
+
+    def fill_async(self, video_id, stream_url, format_id=None):
+        """Queue a background download of a track that has just been played."""
+        if not video_id or not stream_url or not stream_url.startswith("http"):
+            return
+        with self._lock:
+            if video_id in self._pending:
+                return
+            entry = self._index.get(video_id)
+            if entry and entry.get("format_id") == format_id:
+                return
+            self._pending.add(video_id)
+        self._queue.put((video_id, stream_url, format_id))
+        if not self._worker or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._fill_worker, daemon=True)
+            self._worker.start()
+
+    def _fill_worker(self):
+        while True:
+            video_id, stream_url, format_id = self._queue.get()
+            try:
+                self._fill(video_id, stream_url, format_id)
+            except Exception as e:
+                self.metrics["fill_errors"] += 1
+                print(f"Error caching audio for {video_id}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(video_id)
+
+    def _fill(self, video_id, stream_url, format_id):
+        path = self._path_for(video_id, format_id)
+        size = self._download(stream_url, path)
+        now = time.time()
+        entry = {
+            "path": path,
+            "format_id": format_id,
+            "size": size,
+            "created_at": now,
+            "last_access": now,
+            "hits": 0
+        }
+        with self._lock:
+            previous = self._index.get(video_id)
+            self._index[video_id] = entry
+        if previous and previous["path"] != path:
+            self._remove_file(previous["path"])
+        self.cache_store.put(self.NAMESPACE, video_id, entry)
+        self.metrics["fills"] += 1
+        self._evict_to_fit()
+
+    def _download(self, url, path):
+        """Download `url` to `path` in byte ranges; returns the size written."""
+        tmp_path = path + ".part"
+        offset = 0
+        total = None
+        try:
+            with open(tmp_path, 'wb') as f:
+                while total is None or offset < total:
+                    request = urllib.request.Request(url, headers={
+                        "Range": f"bytes={offset}-{offset + CHUNK_SIZE - 1}",
+                        "User-Agent": "Mozilla/5.0"
+                    })
+                    with urllib.request.urlopen(request, timeout=30) as response:
+                        data = response.read()
+                        content_range = response.headers.get("Content-Range", "")
+                        content_length = response.headers.get("Content-Length")
+                    match = re.search(r'/(\d+)$', content_range)
+                    if match:
+                        total = int(match.group(1))
+                    elif content_length and content_length.isdigit():
+                        total = offset + int(content_length)
+                    if not data:
+                        break
+                    f.write(data)
+                    offset += len(data)
+                    if offset > self.max_bytes:
+                        raise ValueError("Track is larger than the whole audio cache")
+                    if not match:
+                        # Server ignored the range and sent the whole body
+                        break
+            if total is not None and offset != total:
+                # Never index a cut-off download as a complete track
+                raise IOError(f"Download ended at {offset} of {total} bytes")
+            os.replace(tmp_path, path)
+        except BaseException:
+            self._remove_file(tmp_path)
+            raise
+        return offset
+
+    def _evict_to_fit(self):
+        """Evict tracks until the cache fits in `max_bytes`."""
+        with self._lock:
+            total = sum(e.get("size", 0) for e in self._index.values())
+            if total <= self.max_bytes:
+                return
+            if self.policy == "lfu":
+                order = sorted(self._index.items(), key=lambda kv: (kv[1].get("hits", 0), kv[1].get("last_access", 0)))
+            else:
+                order = sorted(self._index.items(), key=lambda kv: kv[1].get("last_access", 0))
+            evicted = []
+            for video_id, entry in order:
+                if total <= self.max_bytes:
+                    break
+                del self._index[video_id]
+                total -= entry.get("size", 0)
+                evicted.append((video_id, entry))
+            self.metrics["evictions"] += len(evicted)
+        for video_id, entry in evicted:
+            self._remove_file(entry["path"])
+            self.cache_store.delete(self.NAMESPACE, video_id)
+
+    def _remove_file(self, path):
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            print(f"Error removing cached audio {path}: {e}")
+
+    def clear(self):
+        with self._lock:
+            entries = list(self._index.values())
+            self._index.clear()
+        for entry in entries:
+            self._remove_file(entry["path"])
+        self.cache_store.clear(self.NAMESPACE)
+
+    def get_stats(self):
+        with self._lock:
+            tracks = len(self._index)
+            total = sum(e.get("size", 0) for e in self._index.values())
+            pending = len(self._pending)
+        return {
+            "tracks": tracks,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "policy": self.policy,
+            "pending_fills": pending,
+            **self.metrics
+        }
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark duplicate-playlist detection on import: the previous full scan
+(one ID set per playlist, compared pairwise) vs the video_id -> playlist
+index used by PlaylistManager.find_similar_playlist.
+
+Usage (from the backend directory):
+    python benchmarks/bench_duplicate_detection.py [--playlists N] [--songs N] [--iterations N]
+
+The library is synthetic and lives in a temporary directory; no network.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from playlist_manager import PlaylistManager, SNAPSHOT_VERSION
+
+
+def build_library(path, playlists, songs_per_playlist, catalogue_size):
+    """Write a snapshot with random playlists drawn from a shared catalogue."""
+    rng = random.Random(42)
+    catalogue = [f"vid{i:07d}" for i in range(catalogue_size)]
+    songs = {video_id: {"id": video_id, "title": f"Song {video_id}", "duration": 200} for video_id in catalogue}
+    data = {"version": SNAPSHOT_VERSION, "seq": 0, "songs": songs, "playlists": {}}
+    for i in range(playlists):
+        data["playlists"][f"pl{i}"] = {
+            "name": f"Playlist {i}",
+            "song_ids": rng.sample(catalogue, songs_per_playlist),
+            "source_url": None,
+            "thumbnail": None
+        }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    return data["playlists"]
+
+
+def full_scan(manager, new_song_ids, threshold=0.8):
+    """The detection used before the index: rebuild and compare every playlist."""
+    new_song_ids = set(new_song_ids)
+    for playlist_id in manager.get_playlist_ids():
+        existing_song_ids = set(manager.get_song_ids(playlist_id))
+        if existing_song_ids and new_song_ids:
+            overlap = len(new_song_ids & existing_song_ids)
+            if overlap / max(len(new_song_ids), len(existing_song_ids)) >= threshold:
+                return playlist_id
+    return None
+
+
+def time_calls(fn, imports, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        results = [fn(song_ids) for song_ids in imports]
+    return (time.perf_counter() - start) / (iterations * len(imports)), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--playlists", type=int, default=1000)
+    parser.add_argument("--songs", type=int, default=100, help="Songs per playlist")
+    parser.add_argument("--catalogue", type=int, default=50000, help="Distinct videos in the library")
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "playlists.json")
+        playlists = build_library(path, args.playlists, args.songs, args.catalogue)
+        manager = PlaylistManager(path)
+
+        rng = random.Random(7)
+        target = playlists[f"pl{args.playlists - 1}"]["song_ids"]
+        keep = int(len(target) * 0.9)
+        imports = {
+            # 90% of the last playlist plus new videos: worst case for the scan
+            "near-duplicate": target[:keep] + [f"new{i}" for i in range(len(target) - keep)],
+            "unrelated": [f"new{i}" for i in range(args.songs)],
+            "partial overlap": rng.sample(target, len(target) // 2) + [f"new{i}" for i in range(len(target) // 2)],
+        }
+
+        print(f"{args.playlists} playlists x {args.songs} songs, {args.iterations} iterations")
+        for label, song_ids in imports.items():
+            scan_time, scan_result = time_calls(lambda ids: full_scan(manager, ids), [song_ids], args.iterations)
+            index_time, index_result = time_calls(manager.find_similar_playlist, [song_ids], args.iterations)
+            assert scan_result == index_result, (label, scan_result, index_result)
+            print(f"{label:<16} scan {scan_time * 1000:8.3f}ms  index {index_time * 1000:8.3f}ms  "
+                  f"speedup {scan_time / index_time:7.1f}x  match {index_result[0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-extraction overhead of fresh vs pooled YoutubeDL instances.
+
+Usage (from the backend directory):
+    python benchmarks/bench_extractor_pool.py [--iterations N] [--url URL]
+
+Without --url only instance setup/teardown is measured (no network).
+With --url each iteration also runs a real extract_info, so the numbers
+include the HTTP session and player JS caches that pooling keeps warm.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp as yt
+from extractor_pool import YoutubeDLPool
+
+OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'nocheckcertificate': True,
+    'ignoreerrors': True
+}
+
+
+def run_fresh(iterations, url):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        with yt.YoutubeDL(dict(OPTS)) as ydl:
+            if url:
+                ydl.extract_info(url, download=False)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run_pooled(iterations, url):
+    pool = YoutubeDLPool({"stream": OPTS}, max_per_profile=1)
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        with pool.extractor("stream") as ydl:
+            if url:
+                ydl.extract_info(url, download=False)
+        timings.append(time.perf_counter() - start)
+    stats = pool.get_stats()
+    pool.close()
+    return timings, stats
+
+
+def report(label, timings):
+    timings = sorted(timings)
+    mean = sum(timings) / len(timings)
+    p50 = timings[len(timings) // 2]
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{label:<8} mean {mean * 1000:9.2f}ms  p50 {p50 * 1000:9.2f}ms  p95 {p95 * 1000:9.2f}ms")
+    return mean
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--url", help="Video URL to extract on every iteration")
+    args = parser.parse_args()
+
+    iterations = args.iterations if not args.url else min(args.iterations, 10)
+    print(f"yt-dlp {yt.version.__version__}, {iterations} iterations"
+          f"{' with extraction of ' + args.url if args.url else ' (setup only)'}")
+
+    fresh_mean = report("fresh", run_fresh(iterations, args.url))
+    pooled_timings, stats = run_pooled(iterations, args.url)
+    pooled_mean = report("pooled", pooled_timings)
+
+    print(f"speedup  {fresh_mean / pooled_mean:.1f}x  "
+          f"(created {stats['created']}, reused {stats['reused']}, reuse rate {stats['reuse_rate']}%)")
+
+
+if __name__ == "__main__":
+    main()
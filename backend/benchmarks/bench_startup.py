@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Benchmark startup time-to-ready of the playlist library for each installed
+storage format: migrating a legacy pretty-printed playlists.json, a cold
+start from the manifest, the first read of one playlist, the first write
+after a cold start (time, RSS growth and songs left resident), and the
+bytes a compaction rewrites after one added song.
+
+Usage (from the backend directory):
+    python benchmarks/bench_startup.py [--sizes 1000 10000 100000] [--songs N] [--repeat N]
+
+The library is synthetic and lives in a temporary directory; no network.
+Install msgpack and zstandard to include the binary formats.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from playlist_manager import PlaylistManager
+from storage_format import available_formats
+
+
+def build_snapshot(total_songs, songs_per_playlist):
+    """A version 3 (single file) snapshot with `total_songs` distinct songs split into playlists."""
+    songs = {}
+    playlists = {}
+    for i in range(total_songs):
+        video_id = f"vid{i:07d}"
+        songs[video_id] = {
+            "id": video_id,
+            "title": f"Artist {i % 997} - Song number {i} (Official Video)",
+            "url": f"https://www.youtube.com/watch?v={video_id}",
+            "duration": 180 + i % 120,
+            "thumbnail": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"
+        }
+        playlist_id = f"pl{i // songs_per_playlist}"
+        playlist = playlists.setdefault(playlist_id, {
+            "name": f"Playlist {playlist_id}",
+            "song_ids": [],
+            "source_url": None,
+            "thumbnail": None
+        })
+        playlist["song_ids"].append(video_id)
+    return {"version": 3, "seq": 0, "songs": songs, "playlists": playlists}
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def rss_bytes():
+    """Current resident set size, or None where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def file_sizes(directory):
+    # The library index is a SQLite file updated a few pages at a time, not rewritten
+    return {
+        name: (os.stat(os.path.join(directory, name)).st_mtime_ns, os.path.getsize(os.path.join(directory, name)))
+        for name in os.listdir(directory) if not name.startswith("library.db")
+    }
+
+
+def bench_format(tmp, data, fmt, repeat):
+    directory = os.path.join(tmp, fmt.name)
+    os.makedirs(directory)
+    filename = os.path.join(directory, "playlists.json")
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4)
+
+    migrate, manager = timed(lambda: PlaylistManager(filename, storage_format=fmt.name))
+    manager.close()
+
+    ready = first_read = None
+    for _ in range(repeat):
+        seconds, manager = timed(lambda: PlaylistManager(filename, storage_format=fmt.name))
+        ready = seconds if ready is None else min(ready, seconds)
+        playlist_id = manager.get_playlist_ids()[-1]
+        seconds, _ = timed(lambda: manager.get_songs(playlist_id))
+        first_read = seconds if first_read is None else min(first_read, seconds)
+        resident = len(manager.songs)
+        manager.close()
+
+    # First write after a cold start, then the bytes its compaction rewrites
+    manager = PlaylistManager(filename, storage_format=fmt.name)
+    shards = manager.directory
+    before = file_sizes(shards)
+    rss_before = rss_bytes()
+    first_write, _ = timed(lambda: manager.add_song_to_playlist(
+        playlist_id, {"id": "new-song", "title": "New song", "duration": 200}))
+    rss_after = rss_bytes()
+    write_rss = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+    write_resident = len(manager.songs)
+    manager.close()
+    after = file_sizes(shards)
+    written = sum(size for name, (mtime, size) in after.items() if before.get(name, (None,))[0] != mtime)
+    on_disk = sum(size for _, size in after.values())
+    return migrate, ready, first_read, resident, (first_write, write_rss, write_resident), written, on_disk
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Songs in the library")
+    parser.add_argument("--songs", type=int, default=200, help="Songs per playlist")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    formats = available_formats()
+    print(f"Formats: {', '.join(fmt.name for fmt in formats)}")
+    for size in args.sizes:
+        data = build_snapshot(size, args.songs)
+        print(f"\n{size} songs in {len(data['playlists'])} playlists")
+        with tempfile.TemporaryDirectory() as tmp:
+            legacy = os.path.join(tmp, "legacy.json")
+            with open(legacy, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=4)
+            with open(legacy, 'r', encoding='utf-8') as f:
+                parse, _ = timed(lambda: json.load(f))
+            print(f"  legacy playlists.json parse alone: {parse * 1000:.1f}ms, "
+                  f"{os.path.getsize(legacy) / 1024:.0f} KiB rewritten per change")
+            for fmt in formats:
+                migrate, ready, first_read, resident, write, written, on_disk = bench_format(tmp, data, fmt, args.repeat)
+                first_write, write_rss, write_resident = write
+                rss = f"{write_rss / 2 ** 20:+6.1f} MiB" if write_rss is not None else "     n/a"
+                print(f"  {fmt.name:<13} migrate {migrate * 1000:8.1f}ms  ready {ready * 1000:7.2f}ms  "
+                      f"first playlist {first_read * 1000:6.2f}ms  resident songs {resident:>5}  "
+                      f"first write {first_write * 1000:6.2f}ms {rss} RSS, {write_resident:>5} resident  "
+                      f"per change {written / 1024:6.1f} KiB of {on_disk / 1024:7.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+def _deep_size(obj, seen=None):
+    """Approximate memory footprint of plain JSON-like data."""
+    seen = seen if seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(_deep_size(item, seen) for item in obj)
+    return size
+
+
+class BoundedCache:
+    """
+    Thread-safe in-memory cache bounded by entry count, with LRU eviction
+    and optional per-entry expiry. Expired entries are dropped lazily when
+    read, and by a sweep at most every `purge_interval` seconds on write.
+    """
+
+    def __init__(self, max_entries=5000, default_ttl=None, purge_interval=60):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.purge_interval = purge_interval
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._last_purge = time.time()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, expires_at=None):
+        if expires_at is None and self.default_ttl:
+            expires_at = time.time() + self.default_ttl
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            if time.time() - self._last_purge > self.purge_interval:
+                self._purge_expired_locked()
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and (entry[1] is None or entry[1] > time.time())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[0] if entry else default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def purge_expired(self):
+        """Drop all expired entries and return how many were removed."""
+        with self._lock:
+            return self._purge_expired_locked()
+
+    def _purge_expired_locked(self):
+        now = time.time()
+        expired = [k for k, (_, expires_at) in self._data.items() if expires_at is not None and expires_at <= now]
+        for key in expired:
+            del self._data[key]
+        self.expirations += len(expired)
+        self._last_purge = now
+        return len(expired)
+
+    def memory_usage(self):
+        """Approximate bytes held by the cached keys and values."""
+        with self._lock:
+            items = list(self._data.items())
+        return sum(_deep_size(key) + _deep_size(value) for key, (value, _) in items)
+
+    def get_stats(self):
+        with self._lock:
+            entries = len(self._data)
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "memory_bytes": self.memory_usage(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups * 100, 2) if lookups else 0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
@@ -0,0 +1,139 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class SQLiteCacheStore:
+    """
+    Persistent key/value cache in embedded SQLite.
+    Entries live in a namespace (e.g. "urls", "metadata") and may carry an
+    absolute expiry timestamp; expired entries are never returned. Uses WAL
+    mode so single-row upserts are cheap and a crash can never leave a
+    half-written cache behind.
+    """
+
+    def __init__(self, path="svara_cache.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    expires_at REAL,
+                    PRIMARY KEY (namespace, key)
+                ) WITHOUT ROWID
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cache_expiry ON cache_entries (namespace, expires_at)"
+            )
+
+    @staticmethod
+    def _encode(value):
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+    def get(self, namespace, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache_entries WHERE namespace = ? AND key = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, namespace, key, value, expires_at=None):
+        self.put_many(namespace, [(key, value, expires_at)])
+
+    def put_many(self, namespace, entries):
+        """Upsert an iterable of (key, value, expires_at) tuples in one batch."""
+        now = time.time()
+        rows = [(namespace, key, self._encode(value), now, expires_at) for key, value, expires_at in entries]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO cache_entries (namespace, key, value, updated_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (namespace, key) DO UPDATE SET "
+                "value = excluded.value, updated_at = excluded.updated_at, expires_at = excluded.expires_at",
+                rows
+            )
+
+    def delete(self, namespace, key):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, key)
+            )
+
+    def items(self, namespace):
+        """Return (key, value) pairs for all live entries of a namespace."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM cache_entries WHERE namespace = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, time.time())
+            ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def count(self, namespace):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM cache_entries WHERE namespace = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, time.time())
+            ).fetchone()
+        return row[0]
+
+    def clear(self, namespace=None):
+        with self._lock, self._conn:
+            if namespace is None:
+                self._conn.execute("DELETE FROM cache_entries")
+            else:
+                self._conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (namespace,))
+
+    def purge_expired(self):
+        """Delete expired entries and return how many were removed."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (time.time(),)
+            )
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def migrate_json_file(store, namespace, path, expiry_for=None):
+    """
+    Import a legacy JSON cache file into `store` with one batched upsert.
+    The file is renamed afterwards so it is only ever imported once.
+    Returns the number of imported entries.
+    """
+    if not os.path.exists(path):
+        return 0
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"Error reading legacy cache {path}: {e}")
+        data = {}
+
+    entries = [
+        (key, value, expiry_for(key, value) if expiry_for else None)
+        for key, value in data.items()
+    ]
+    store.put_many(namespace, entries)
+    try:
+        os.replace(path, path + ".migrated")
+    except OSError as e:
+        print(f"Error renaming legacy cache {path}: {e}")
+    return len(entries)
@@ -0,0 +1,137 @@
+import threading
+import time
+from contextlib import contextmanager
+import yt_dlp as yt
+
+
+class YoutubeDLPool:
+    """
+    Thread-safe pool of warm YoutubeDL instances keyed by option profile.
+    Reusing instances keeps extractor initialization, the HTTP session and
+    cookie jar, and the player JS caches across extractions.
+    A YoutubeDL instance is not thread-safe, so each one is checked out by
+    exactly one caller at a time.
+    """
+
+    def __init__(self, profiles, max_per_profile=4):
+        self.profiles = profiles  # profile name -> yt-dlp options
+        self.max_per_profile = max_per_profile
+        self._idle = {name: [] for name in profiles}
+        self._in_use = {name: 0 for name in profiles}
+        self._cond = threading.Condition()
+        self._closed = False
+        self.metrics = {
+            "checkouts": 0,
+            "created": 0,
+            "reused": 0,
+            "discarded": 0,
+            "waits": 0,
+            "wait_time": 0.0
+        }
+
+    def checkout(self, profile, timeout=None):
+        """Take an instance for `profile`, creating one if the pool allows it."""
+        if profile not in self.profiles:
+            raise KeyError(f"Unknown extractor profile: {profile}")
+
+        with self._cond:
+            wait_start = None
+            while True:
+                if self._closed:
+                    raise RuntimeError("Extractor pool is closed")
+                if self._idle[profile]:
+                    ydl = self._idle[profile].pop()
+                    self.metrics["reused"] += 1
+                    break
+                if self._total(profile) < self.max_per_profile:
+                    ydl = None
+                    break
+                if wait_start is None:
+                    wait_start = time.time()
+                    self.metrics["waits"] += 1
+                remaining = None if timeout is None else timeout - (time.time() - wait_start)
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"No free extractor for profile '{profile}'")
+                self._cond.wait(remaining)
+
+            if wait_start is not None:
+                self.metrics["wait_time"] += time.time() - wait_start
+            # Reserve the slot; new instances are built outside the lock
+            self._in_use[profile] += 1
+            self.metrics["checkouts"] += 1
+            if ydl is not None:
+                return ydl
+
+        try:
+            ydl = yt.YoutubeDL(dict(self.profiles[profile]))
+        except Exception:
+            with self._cond:
+                self._in_use[profile] -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.metrics["created"] += 1
+        return ydl
+
+    def checkin(self, profile, ydl, discard=False):
+        """Return an instance to the pool, or close it when `discard` is set."""
+        with self._cond:
+            self._in_use[profile] -= 1
+            keep = not discard and not self._closed
+            if keep:
+                self._idle[profile].append(ydl)
+            else:
+                self.metrics["discarded"] += 1
+            self._cond.notify()
+        if not keep:
+            self._close_instance(ydl)
+
+    @contextmanager
+    def extractor(self, profile, timeout=None):
+        """Context manager around checkout/checkin."""
+        ydl = self.checkout(profile, timeout)
+        discard = False
+        try:
+            yield ydl
+        except yt.DownloadError:
+            # Ordinary extraction failures leave the instance usable
+            raise
+        except Exception:
+            # Unexpected failures may leave the instance in a bad state
+            discard = True
+            raise
+        finally:
+            self.checkin(profile, ydl, discard=discard)
+
+    def _total(self, profile):
+        return len(self._idle[profile]) + self._in_use[profile]
+
+    def _close_instance(self, ydl):
+        try:
+            ydl.close()
+        except Exception as e:
+            print(f"Error closing extractor: {e}")
+
+    def get_stats(self):
+        """Return pool metrics plus per-profile idle/in-use counts."""
+        with self._cond:
+            stats = dict(self.metrics)
+            stats["wait_time_ms"] = round(stats.pop("wait_time") * 1000, 2)
+            stats["profiles"] = {
+                name: {"idle": len(self._idle[name]), "in_use": self._in_use[name]}
+                for name in self.profiles
+            }
+        total = stats["created"] + stats["reused"]
+        stats["reuse_rate"] = round(stats["reused"] / total * 100, 2) if total else 0
+        return stats
+
+    def close(self):
+        """Close all idle instances; checked-out ones are closed on checkin."""
+        with self._cond:
+            self._closed = True
+            idle = [ydl for instances in self._idle.values() for ydl in instances]
+            for instances in self._idle.values():
+                instances.clear()
+            self._cond.notify_all()
+        for ydl in idle:
+            self._close_instance(ydl)
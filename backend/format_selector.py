@@ -0,0 +1,84 @@
+CODEC_PREFERENCE = {"opus": 2, "mp4a": 1}  # More efficient codecs first at equal bitrate
+
+
+def _bitrate(fmt):
+    return fmt.get('abr') or fmt.get('tbr') or 0
+
+
+def _size(fmt):
+    return fmt.get('filesize') or fmt.get('filesize_approx') or 0
+
+
+def _codec_rank(fmt):
+    codec = (fmt.get('acodec') or '').split('.')[0]
+    return CODEC_PREFERENCE.get(codec, 0)
+
+
+def _is_opus(fmt):
+    return (fmt.get('acodec') or '').startswith('opus')
+
+
+def audio_only_formats(formats):
+    """Return playable audio-only entries of a yt-dlp `formats` list."""
+    return [
+        f for f in formats or []
+        if f.get('url') and f.get('acodec') not in (None, 'none') and f.get('vcodec') == 'none'
+    ]
+
+
+def _first_audio(formats, min_bitrate):
+    return formats[0]
+
+
+def _lowest_adequate(formats, min_bitrate):
+    adequate = [f for f in formats if _bitrate(f) >= min_bitrate]
+    if adequate:
+        return min(adequate, key=lambda f: (_bitrate(f), _size(f), -_codec_rank(f)))
+    # Nothing reaches the floor: take the best that is available
+    return _best_quality(formats, min_bitrate)
+
+
+def _best_opus(formats, min_bitrate):
+    opus = [f for f in formats if _is_opus(f)]
+    return _best_quality(opus or formats, min_bitrate)
+
+
+def _best_quality(formats, min_bitrate):
+    return max(formats, key=lambda f: (_bitrate(f), _codec_rank(f), -_size(f)))
+
+
+def _data_saver(formats, min_bitrate):
+    return min(formats, key=lambda f: (_bitrate(f) or float('inf'), _size(f), -_codec_rank(f)))
+
+
+POLICIES = {
+    "first_audio": _first_audio,  # Previous behaviour: first audio-only entry
+    "lowest_adequate": _lowest_adequate,
+    "best_opus": _best_opus,
+    "best_quality": _best_quality,
+    "data_saver": _data_saver,
+}
+
+
+class FormatSelector:
+    """
+    Picks the audio stream to play from a yt-dlp `formats` list according
+    to a named policy. Formats are ranked by bitrate (abr), file size and
+    codec; `min_bitrate` (kbps) is the floor for "lowest_adequate".
+    """
+
+    def __init__(self, policy="lowest_adequate", min_bitrate=96):
+        self.set_policy(policy)
+        self.min_bitrate = min_bitrate
+
+    def set_policy(self, policy):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown format policy '{policy}'. Choose from: {', '.join(POLICIES)}")
+        self.policy = policy
+
+    def select(self, formats):
+        """Return the chosen format dict, or None if there is no audio-only format."""
+        candidates = audio_only_formats(formats)
+        if not candidates:
+            return None
+        return POLICIES[self.policy](candidates, self.min_bitrate)
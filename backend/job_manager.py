@@ -0,0 +1,196 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job function once its job has been cancelled."""
+
+
+class Job:
+    """One background operation (e.g. a playlist import) and its progress."""
+
+    def __init__(self, kind, key, manager):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.key = key
+        self.status = QUEUED
+        self.progress = {"current": 0, "total": 0, "message": None}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._manager = manager
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        """Raise JobCancelled if the job was cancelled; call between units of work."""
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def report(self, message):
+        """Record a progress message (current/total/message fields) and publish it."""
+        for field in ("current", "total", "message"):
+            if field in message:
+                self.progress[field] = message[field]
+        self._manager._publish(self, message)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "key": self.key,
+            "status": self.status,
+            "progress": dict(self.progress),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+
+class JobManager:
+    """
+    Runs long operations such as playlist imports on a small worker pool so
+    HTTP handlers can return a job ID at once. A submit for a key (e.g. a
+    playlist URL) that already has a queued or running job returns that job
+    instead of starting a second one. Cancellation is cooperative: job
+    functions call `job.check_cancelled()` between units of work.
+
+    `on_update(job, message)` is called from worker threads on every status
+    change (message None) and progress report; the most recent `history`
+    finished jobs stay queryable.
+    """
+
+    def __init__(self, max_workers=2, history=100, on_update=None):
+        self.on_update = on_update
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()  # job_id -> Job, oldest first
+        self._active = {}  # key -> Job still queued or running
+        self._lock = threading.Lock()
+        self.metrics = {
+            "submitted": 0,
+            "deduplicated": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "cancelled": 0
+        }
+
+    def submit(self, kind, key, fn):
+        """
+        Queue `fn(job)` as a job of `kind` for `key`; its return value becomes
+        the job's result. Returns (job, created), where created is False if an
+        active job for `key` was returned instead.
+        """
+        with self._lock:
+            job = self._active.get(key)
+            if job is not None:
+                self.metrics["deduplicated"] += 1
+                return job, False
+            job = Job(kind, key, self)
+            self._jobs[job.id] = job
+            self._active[key] = job
+            self.metrics["submitted"] += 1
+            self._prune()
+        self._publish(job)
+        self._executor.submit(self._run, job, fn)
+        return job, True
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self, active_only=False):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job for job in jobs if not active_only or job.status in ACTIVE_STATES]
+
+    def cancel(self, job_id):
+        """Request cancellation; returns the job, or None if unknown. Finished jobs are left as they are."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status not in ACTIVE_STATES:
+                return job
+            job._cancel.set()
+            if job.status == QUEUED:
+                # Never started; _run will see the flag and skip it
+                self._finish(job, CANCELLED)
+                publish = True
+            else:
+                publish = False
+        if publish:
+            self._publish(job)
+        return job
+
+    def _run(self, job, fn):
+        with self._lock:
+            if job.status != QUEUED:
+                return
+            job.status = RUNNING
+            job.started_at = time.time()
+        self._publish(job)
+
+        status, result, error = SUCCEEDED, None, None
+        try:
+            job.check_cancelled()
+            result = fn(job)
+        except JobCancelled:
+            status = CANCELLED
+        except Exception as e:
+            print(f"Job {job.id} ({job.kind} {job.key}) failed: {e}")
+            status, error = FAILED, str(e)
+
+        with self._lock:
+            job.result = result
+            job.error = error
+            self._finish(job, CANCELLED if job.cancelled and status != SUCCEEDED else status)
+        self._publish(job)
+
+    def _finish(self, job, status):
+        """Mark `job` finished; caller holds the lock."""
+        job.status = status
+        job.finished_at = time.time()
+        if self._active.get(job.key) is job:
+            del self._active[job.key]
+        self.metrics[status] += 1
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond `history`; caller holds the lock."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status not in ACTIVE_STATES]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+    def _publish(self, job, message=None):
+        if self.on_update is None:
+            return
+        try:
+            self.on_update(job, message)
+        except Exception as e:
+            print(f"Job update callback error: {e}")
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.metrics, active=len(self._active), tracked=len(self._jobs))
+
+    def shutdown(self):
+        """Cancel every active job and stop the workers without waiting for them."""
+        for job in self.list_jobs(active_only=True):
+            self.cancel(job.id)
+        self._executor.shutdown(wait=False, cancel_futures=True)
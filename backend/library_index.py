@@ -0,0 +1,258 @@
+import json
+import sqlite3
+import threading
+
+_CHUNK = 500  # Keys per IN (...) query, well under SQLite's variable limit
+
+
+class _Layer:
+    """Changes to the index not yet written to the database."""
+    __slots__ = ("members", "reset", "songs")
+
+    def __init__(self):
+        self.members = {}  # key -> {playlist_id: True if held, False if removed}
+        self.reset = set()  # Playlists whose older memberships no longer count
+        self.songs = {}    # key -> song dict
+
+
+class LibraryIndex:
+    """
+    Library-wide index persisted in SQLite next to the playlist manifest:
+    which playlists hold each song, and the current metadata of every song
+    in the library. PlaylistManager uses it for cross-playlist lookups
+    (duplicate detection, the playlists holding a song, metadata of songs in
+    unloaded playlists) without reading any shard.
+
+    Changes are recorded in memory as they are applied (O(change)) and
+    written out by `write` at compaction time, together with the seq they
+    cover. Queries read the database with the unwritten changes layered on
+    top, so they never wait for a compaction. Membership changes are
+    idempotent, which makes replaying journal records the index already
+    covers harmless.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()  # Layers and the read connection
+        self._write_lock = threading.Lock()
+        self._layers = [_Layer()]  # Oldest first; the last one takes new changes
+        self._read = self._connect()
+        self._conn = self._connect()
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS songs (
+                    key TEXT PRIMARY KEY,
+                    data TEXT NOT NULL
+                ) WITHOUT ROWID
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS members (
+                    key TEXT NOT NULL,
+                    playlist_id TEXT NOT NULL,
+                    PRIMARY KEY (key, playlist_id)
+                ) WITHOUT ROWID
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_members_playlist ON members (playlist_id)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER) WITHOUT ROWID"
+            )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    def _encode(song):
+        return json.dumps(song, ensure_ascii=False, separators=(',', ':'))
+
+    @property
+    def seq(self):
+        """Seq of the last write, or None if the index was never built."""
+        with self._lock:
+            row = self._read.execute("SELECT value FROM meta WHERE name = 'seq'").fetchone()
+        return row[0] if row else None
+
+    # Changes, applied under the playlist manager's commit lock
+    def add(self, key, playlist_id):
+        with self._lock:
+            self._layers[-1].members.setdefault(key, {})[playlist_id] = True
+
+    def remove(self, key, playlist_id):
+        with self._lock:
+            self._layers[-1].members.setdefault(key, {})[playlist_id] = False
+
+    def reset_playlist(self, playlist_id, keys=()):
+        """Replace everything recorded for a playlist with `keys` (none when it is deleted)."""
+        with self._lock:
+            layer = self._layers[-1]
+            for members in layer.members.values():
+                members.pop(playlist_id, None)
+            layer.reset.add(playlist_id)
+            for key in keys:
+                layer.members.setdefault(key, {})[playlist_id] = True
+
+    def put_song(self, key, song):
+        with self._lock:
+            self._layers[-1].songs[key] = song
+
+    # Queries
+    def _db_rows(self, sql, keys):
+        rows = []
+        keys = list(keys)
+        for start in range(0, len(keys), _CHUNK):
+            chunk = keys[start:start + _CHUNK]
+            rows += self._read.execute(sql.format(",".join("?" * len(chunk))), chunk).fetchall()
+        return rows
+
+    def _held(self, key, playlist_id, in_db):
+        """Resolve one membership through the layers, newest first; caller holds the lock."""
+        for layer in reversed(self._layers):
+            members = layer.members.get(key)
+            if members and playlist_id in members:
+                return members[playlist_id]
+            if playlist_id in layer.reset:
+                return False
+        return in_db
+
+    def holders_many(self, keys):
+        """Return {key: [playlist IDs holding it]} for every key held anywhere."""
+        keys = {key for key in keys if key}
+        if not keys:
+            return {}
+        with self._lock:
+            stored = {}
+            for key, playlist_id in self._db_rows("SELECT key, playlist_id FROM members WHERE key IN ({})", keys):
+                stored.setdefault(key, set()).add(playlist_id)
+            result = {}
+            for key in keys:
+                candidates = dict.fromkeys(stored.get(key, ()))
+                for layer in self._layers:
+                    candidates.update(dict.fromkeys(layer.members.get(key, ())))
+                held = [pid for pid in candidates if self._held(key, pid, pid in stored.get(key, ()))]
+                if held:
+                    result[key] = held
+            return result
+
+    def holders(self, key):
+        return self.holders_many([key]).get(key, [])
+
+    def playlist_songs(self, playlist_id):
+        """Distinct keys a playlist holds."""
+        with self._lock:
+            stored = {key for key, in self._read.execute(
+                "SELECT key FROM members WHERE playlist_id = ?", (playlist_id,))}
+            candidates = set(stored)
+            for layer in self._layers:
+                candidates.update(key for key, members in layer.members.items() if playlist_id in members)
+            return [key for key in candidates if self._held(key, playlist_id, key in stored)]
+
+    def songs_many(self, keys):
+        """Return {key: song} for the keys the library has metadata for."""
+        keys = {key for key in keys if key}
+        if not keys:
+            return {}
+        with self._lock:
+            pending = {}
+            for layer in self._layers:
+                pending.update((key, layer.songs[key]) for key in keys if key in layer.songs)
+            missing = keys - pending.keys()
+            rows = self._db_rows("SELECT key, data FROM songs WHERE key IN ({})", missing) if missing else []
+        result = {key: json.loads(data) for key, data in rows}
+        result.update(pending)
+        return result
+
+    def song(self, key):
+        return self.songs_many([key]).get(key)
+
+    def iter_songs(self):
+        """Yield (key, song) for every song in the library, e.g. to build a search index."""
+        with self._lock:
+            pending = {}
+            for layer in self._layers:
+                pending.update(layer.songs)
+            rows = self._read.execute("SELECT key, data FROM songs").fetchall()
+        for key, data in rows:
+            if key not in pending:
+                yield key, json.loads(data)
+        held = self.holders_many(pending)  # Unwritten songs may have lost their last playlist already
+        yield from ((key, song) for key, song in pending.items() if key in held)
+
+    # Persistence, serialized by the caller (the manager's compaction lock)
+    def freeze(self):
+        """Start a new layer; changes before this call go out with the next `write`."""
+        with self._lock:
+            self._layers.append(_Layer())
+
+    def write(self, seq):
+        """
+        Write the changes recorded before the last `freeze` in one
+        transaction and mark the index current as of `seq`. Songs no
+        playlist holds any more are dropped.
+        """
+        with self._lock:
+            frozen = self._layers[:-1]
+        with self._write_lock, self._conn:
+            orphans = set()
+            for layer in frozen:
+                for playlist_id in layer.reset:
+                    orphans.update(key for key, in self._conn.execute(
+                        "SELECT key FROM members WHERE playlist_id = ?", (playlist_id,)))
+                    self._conn.execute("DELETE FROM members WHERE playlist_id = ?", (playlist_id,))
+                added, removed = [], []
+                for key, members in layer.members.items():
+                    for playlist_id, held in members.items():
+                        (added if held else removed).append((key, playlist_id))
+                self._conn.executemany("INSERT OR IGNORE INTO members (key, playlist_id) VALUES (?, ?)", added)
+                self._conn.executemany("DELETE FROM members WHERE key = ? AND playlist_id = ?", removed)
+                orphans.update(key for key, _ in removed)
+                orphans.update(layer.songs)
+                self._conn.executemany(
+                    "INSERT INTO songs (key, data) VALUES (?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET data = excluded.data",
+                    [(key, self._encode(song)) for key, song in layer.songs.items()]
+                )
+            self._conn.executemany(
+                "DELETE FROM songs WHERE key = ? AND NOT EXISTS (SELECT 1 FROM members WHERE key = ?)",
+                [(key, key) for key in orphans]
+            )
+            self._set_seq(seq)
+        with self._lock:
+            del self._layers[:len(frozen)]
+
+    def rebuild(self, playlists, seq):
+        """
+        Replace the whole index with `playlists`, an iterable of
+        (playlist_id, song_ids, {key: song}); for a missing or stale index.
+        """
+        with self._write_lock, self._conn:
+            self._conn.execute("DELETE FROM members")
+            self._conn.execute("DELETE FROM songs")
+            for playlist_id, song_ids, songs in playlists:
+                keys = set(key for key in song_ids if key)
+                self._conn.executemany("INSERT INTO members (key, playlist_id) VALUES (?, ?)",
+                                       [(key, playlist_id) for key in keys])
+                self._conn.executemany(
+                    "INSERT INTO songs (key, data) VALUES (?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET data = excluded.data",
+                    [(key, self._encode(songs[key])) for key in keys if key in songs]
+                )
+            self._set_seq(seq)
+        with self._write_lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")  # Don't leave the whole library in the WAL
+        with self._lock:
+            self._layers = [_Layer()]
+
+    def _set_seq(self, seq):
+        self._conn.execute(
+            "INSERT INTO meta (name, value) VALUES ('seq', ?) "
+            "ON CONFLICT (name) DO UPDATE SET value = excluded.value", (seq,)
+        )
+
+    def close(self):
+        with self._write_lock, self._lock:
+            self._read.close()
+            self._conn.close()
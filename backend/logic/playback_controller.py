@@ -3,6 +3,7 @@ import random
 import time
 from player import MusicPlayer
 from performance_logger import perf_logger
+from preload_scheduler import PRIORITY_NEXT, PRIORITY_QUEUE
 
 class PlaybackController:
     def __init__(self, main_logic):
@@ -10,7 +11,7 @@ class PlaybackController:
         self.ui = main_logic.ui
         
         # Initialize music player
-        self.music_player = MusicPlayer(self.ui, self.play_next_song)
+        self.music_player = MusicPlayer(self.ui, self._on_song_end)
         
         # Playback state
         self.current_song_info = None
@@ -19,6 +20,26 @@ class PlaybackController:
         self.shuffled_indices = []
         self.current_shuffled_index = -1
         self.last_volume = 0.5
+        self._streamed_track = None  # (video_id, stream_url, format_id) playing from the network
+
+    def _on_song_end(self):
+        """Cache the track that just played to the end, then move on."""
+        self._cache_finished_track()
+        self.play_next_song()
+
+    def _cache_finished_track(self):
+        """
+        Copy a fully played streamed track into the audio cache. Filling only
+        after playback keeps the download from competing with VLC's stream;
+        under the data-saver policy nothing is downloaded twice.
+        """
+        track, self._streamed_track = self._streamed_track, None
+        if not track:
+            return
+        yt_streamer = self.main_logic.youtube_controller.yt_streamer
+        if yt_streamer.format_selector.policy == "data_saver":
+            return
+        yt_streamer.audio_cache.fill_async(*track)
 
     def play_song_by_index(self, index):
         """Play a song by its index in the current playlist."""
@@ -129,8 +150,8 @@ class PlaybackController:
 
     def _play_first_available(self):
         """Start playing the first available playlist."""
-        playlists = self.main_logic.playlist_manager.get_all_playlists()
-        first_playlist_id = list(playlists.keys())[0] if playlists else None
+        playlist_ids = self.main_logic.playlist_manager.get_playlist_ids()
+        first_playlist_id = playlist_ids[0] if playlist_ids else None
         if first_playlist_id:
             self.main_logic.display_playlist_songs(first_playlist_id)
             self.play_song_by_index(0)
@@ -257,7 +278,18 @@ class PlaybackController:
     def _play_with_fresh_url(self, song):
         """Fetch fresh URL and play song in background thread."""
         try:
-            fresh_url = self.main_logic.youtube_controller.yt_streamer.get_fresh_stream_url(song['id'])
+            yt_streamer = self.main_logic.youtube_controller.yt_streamer
+            # Replays come straight from the local audio cache
+            fresh_url = yt_streamer.audio_cache.lookup(song['id'])
+            if fresh_url:
+                perf_logger.log_song_load(song['id'], song.get('title', 'Unknown'), 0, from_cache=True)
+            else:
+                fresh_url = yt_streamer.get_fresh_stream_url(song['id'])
+                yt_streamer.mark_hot([song['id']])
+            # Cached once it has played to the end (see _cache_finished_track)
+            self._streamed_track = None
+            if fresh_url and fresh_url.startswith("http"):
+                self._streamed_track = (song['id'], fresh_url, yt_streamer.get_cached_format_id(song['id']))
             if fresh_url:
                 # Update song info with fresh URL
                 song_with_url = song.copy()
@@ -299,12 +331,17 @@ class PlaybackController:
         
         if upcoming_ids:
             # Count cache hits before preloading
-            cache_hits = sum(1 for vid_id in upcoming_ids 
-                           if vid_id in self.main_logic.youtube_controller.yt_streamer.url_cache)
+            yt_streamer = self.main_logic.youtube_controller.yt_streamer
+            cache_hits = sum(1 for vid_id in upcoming_ids if yt_streamer.has_valid_url(vid_id))
             cache_misses = len(upcoming_ids) - cache_hits
             
             perf_logger.log_cache_operation("preload_upcoming", upcoming_ids, cache_hits, cache_misses)
-            self.main_logic.youtube_controller.yt_streamer.preload_song_urls(upcoming_ids)
+            # Songs queued for the previous track are superseded by this one
+            yt_streamer.preload_scheduler.cancel_group("upcoming")
+            yt_streamer.preload_song_urls(upcoming_ids[:1], PRIORITY_NEXT, group="upcoming")
+            yt_streamer.preload_song_urls(upcoming_ids[1:], PRIORITY_QUEUE, group="upcoming")
+            # Keep the queued songs' URLs valid until they are reached
+            yt_streamer.mark_hot(upcoming_ids)
 
     def stop_and_cleanup(self):
         """Stop playback and clean up resources."""
@@ -1,5 +1,6 @@
 import threading
-from playlist_manager import PlaylistManager
+from playlist_manager import PlaylistManager, song_key
+from search_index import tokenize
 
 class PlaylistController:
     def __init__(self, main_logic):
@@ -49,12 +50,19 @@ class PlaylistController:
             return
         
         songs = self.playlist_manager.get_songs(self.main_logic.current_playlist_id)
-        filtered_songs = [
-            s for s in songs 
-            if search_term.lower() in s['title'].lower()
-        ]
+        if search_term.strip():
+            # The search index only narrows the candidates (it needs words of 3+
+            # letters); matching stays a substring check, in playlist order
+            words = [word for word in tokenize(search_term) if len(word) >= 3]
+            if words:
+                matches, _ = self.playlist_manager.search_songs(
+                    " ".join(words), playlist_id=self.main_logic.current_playlist_id, limit=None
+                )
+                candidates = {song_key(s) for s in matches}
+                songs = [s for s in songs if song_key(s) in candidates]
+            songs = [s for s in songs if search_term.lower() in s['title'].lower()]
         
-        self.main_logic.songs_to_add = filtered_songs
+        self.main_logic.songs_to_add = songs
         self.ui.after(10, self._update_ui_with_songs_in_chunks)
 
     def remove_song_by_index(self, index_to_remove):
@@ -116,9 +124,20 @@ class PlaylistController:
             return True
         return False
 
+    def add_songs_to_playlist(self, playlist_id, songs):
+        """Add several songs to a playlist at once, skipping ones it already has."""
+        added_ids = self.playlist_manager.add_songs_to_playlist(playlist_id, songs)
+        if added_ids and self.main_logic.current_playlist_id == playlist_id:
+            self.display_playlist_songs(playlist_id)
+        return added_ids
+
     def create_new_playlist_with_song(self, name, song_info):
         """Create a new playlist with a single song."""
-        playlist_id = self.playlist_manager.add_new_playlist(name, [song_info])
+        return self.create_new_playlist_with_songs(name, [song_info])
+
+    def create_new_playlist_with_songs(self, name, songs):
+        """Create a new playlist holding `songs`."""
+        playlist_id = self.playlist_manager.add_new_playlist(name, songs)
         # Don't call UI methods directly from here - let the main logic handle UI updates
         self.display_playlist_songs(playlist_id)
         return playlist_id
@@ -131,13 +150,11 @@ class PlaylistController:
 
     def get_playlist_info(self, playlist_id):
         """Get information about a specific playlist."""
-        all_playlists = self.playlist_manager.get_all_playlists()
-        return all_playlists.get(playlist_id, {})
+        return self.playlist_manager.get_playlist(playlist_id) or {}
 
     def playlist_exists(self, playlist_id):
         """Check if a playlist exists."""
-        all_playlists = self.playlist_manager.get_all_playlists()
-        return playlist_id in all_playlists
+        return self.playlist_manager.has_playlist(playlist_id)
 
     def get_playlist_by_url(self, url):
         """Get playlist ID by source URL."""
@@ -1,11 +1,16 @@
+import asyncio
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from youtube_streamer import YouTubeStreamer
+from performance_logger import perf_logger
 
 class YouTubeController:
     def __init__(self, main_logic):
         self.main_logic = main_logic
         self.ui = main_logic.ui
         self.progress_callback = None
+        self.max_concurrent_fetches = 8  # Parallel yt-dlp extractions during import
         
         # Initialize YouTube streamer
         self.yt_streamer = YouTubeStreamer(
@@ -35,7 +40,24 @@ class YouTubeController:
             daemon=True
         ).start()
 
-    def _process_playlist_songs_thread(self, playlist_name, songs, thumbnail, source_url):
+    def import_playlist(self, url, job):
+        """
+        Import or sync the playlist at `url` on the calling thread, reporting
+        progress to `job` and stopping early once it is cancelled. Returns the
+        result dict of the create or sync.
+        """
+        job.report({"message": "Getting playlist info..."})
+        playlist_info = self.yt_streamer.fetch_playlist_info(url)
+        job.check_cancelled()
+        return self._process_playlist_songs_thread(
+            playlist_info.get('title', 'Unknown Playlist'),
+            playlist_info.get('entries', []),
+            playlist_info.get('thumbnail_url'),
+            playlist_info.get('original_url'),
+            job
+        )
+
+    def _process_playlist_songs_thread(self, playlist_name, songs, thumbnail, source_url, job=None):
         """Process playlist songs in a background thread."""
         existing_playlist_id = self.main_logic.playlist_manager.get_playlist_by_url(source_url)
         
@@ -44,210 +66,81 @@ class YouTubeController:
             existing_playlist_id = self._find_duplicate_playlist_by_content(songs)
         
         if existing_playlist_id:
-            self._update_existing_playlist(existing_playlist_id, playlist_name, songs, thumbnail)
-        else:
-            self._create_new_playlist(playlist_name, songs, source_url, thumbnail)
+            return self._update_existing_playlist(existing_playlist_id, playlist_name, songs, thumbnail, job)
+        return self._create_new_playlist(playlist_name, songs, source_url, thumbnail, job)
 
-    def _update_existing_playlist(self, playlist_id, playlist_name, songs, thumbnail):
+    def _update_existing_playlist(self, playlist_id, playlist_name, songs, thumbnail, job=None):
         """Update an existing playlist with new songs."""
-        old_songs = self.main_logic.playlist_manager.get_songs(playlist_id)
-        old_ids = {s['id'] for s in old_songs}
-        new_ids = {s['id'] for s in songs}
-        
-        added_ids = new_ids - old_ids
-        removed_ids = old_ids - new_ids
-        total_songs = len(songs)
+        playlist_manager = self.main_logic.playlist_manager
+        old_ids = set(playlist_manager.get_song_ids(playlist_id))
+        new_entries = [s for s in songs if s['id'] not in old_ids]
+        total_songs = len(new_entries)
         
         # Send initial progress
-        if self.progress_callback:
-            import asyncio
-            import threading
-            def send_progress():
-                try:
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    loop.run_until_complete(self.progress_callback({
-                        "type": "progress",
-                        "current": 0,
-                        "total": total_songs,
-                        "message": f"Syncing {total_songs} songs..."
-                    }))
-                    loop.close()
-                except Exception as e:
-                    print(f"Progress callback error: {e}")
-            threading.Thread(target=send_progress, daemon=True).start()
-
-        # Build complete updated song list
-        updated_songs = []
-        
-        # Add all songs from YouTube in correct order
-        for i, song in enumerate(songs):
-            # Send progress update first
-            if self.progress_callback:
-                import asyncio
-                import threading
-                def send_progress():
-                    try:
-                        loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(loop)
-                        loop.run_until_complete(self.progress_callback({
-                            "type": "progress",
-                            "current": i + 1,
-                            "total": total_songs,
-                            "message": f"Syncing {i + 1}/{total_songs} songs",
-                            "song_title": song.get('title', 'Unknown')
-                        }))
-                        loop.close()
-                    except Exception as e:
-                        print(f"Progress callback error: {e}")
-                threading.Thread(target=send_progress, daemon=True).start()
-            
-            if song['id'] in old_ids:
-                # Check if we have cached metadata, otherwise re-fetch
-                cached_info = self.yt_streamer._get_cached_metadata(song['id'])
-                if cached_info:
-                    updated_songs.append(cached_info)
-                else:
-                    # Cache was cleared, re-fetch metadata for existing song
-                    print(f"Re-fetching metadata for existing song: {song['id']}")
-                    full_info = self.yt_streamer.fetch_full_song_info(song['url'])
-                    if full_info:
-                        updated_songs.append(full_info)
-                    else:
-                        # Fallback to existing data if fetch fails
-                        existing_song = next(s for s in old_songs if s['id'] == song['id'])
-                        updated_songs.append(existing_song)
-            else:
-                # New song - fetch full info
-                cached_info = self.yt_streamer._get_cached_metadata(song['id'])
-                if cached_info:
-                    updated_songs.append(cached_info)
-                else:
-                    print(f"Fetching full info for new song: {song['id']}")
-                    full_info = self.yt_streamer.fetch_full_song_info(song['url'])
-                    if full_info:
-                        updated_songs.append(full_info)
-                    else:
-                        # Add basic info even if full fetch fails
-                        updated_songs.append({
-                            'id': song['id'],
-                            'title': song.get('title', 'Unknown Title'),
-                            'duration': 0,
-                            'thumbnail_url': song.get('thumbnail_url')
-                        })
+        self._send_progress({
+            "type": "progress",
+            "current": 0,
+            "total": total_songs,
+            "message": f"Syncing {total_songs} new songs..."
+        }, job)
+
+        # Only songs new to this playlist need metadata; kept and moved songs
+        # are already stored
+        new_songs = self._fetch_songs_info(new_entries, "Syncing", job) if new_entries else []
+        if job:
+            job.check_cancelled()
         
-        # Update the entire playlist with the new song order
-        self.main_logic.playlist_manager.update_playlist_songs(playlist_id, updated_songs)
+        # Apply just the ordered diff against the stored song order
+        result = playlist_manager.sync_playlist_songs(playlist_id, [s['id'] for s in songs], new_songs)
+        added_ids, removed_ids, _ = result or (set(), set(), set())
 
         # Update metadata
         self._update_playlist_metadata(playlist_id, playlist_name, thumbnail)
         
         # Send completion
-        if self.progress_callback:
-            import asyncio
-            import threading
-            def send_completion():
-                try:
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    loop.run_until_complete(self.progress_callback({
-                        "type": "complete",
-                        "message": f"Playlist '{playlist_name}' synced successfully!",
-                        "added": len(added_ids),
-                        "removed": len(removed_ids)
-                    }))
-                    loop.close()
-                except Exception as e:
-                    print(f"Progress callback error: {e}")
-            threading.Thread(target=send_completion, daemon=True).start()
+        self._send_progress({
+            "type": "complete",
+            "message": f"Playlist '{playlist_name}' synced successfully!",
+            "added": len(added_ids),
+            "removed": len(removed_ids)
+        }, job)
 
         # Update UI
         self._update_ui_after_playlist_sync(playlist_id, playlist_name, added_ids, removed_ids)
+        return {
+            "playlist_id": playlist_id,
+            "created": False,
+            "added": len(added_ids),
+            "removed": len(removed_ids),
+            "total_songs": playlist_manager.get_song_count(playlist_id)
+        }
 
-    def _create_new_playlist(self, playlist_name, songs, source_url, thumbnail):
+    def _create_new_playlist(self, playlist_name, songs, source_url, thumbnail, job=None):
         """Create a new playlist from YouTube data."""
-        full_songs = []
         total_songs = len(songs)
         
         # Send initial progress
-        if self.progress_callback:
-            import asyncio
-            import threading
-            def send_progress():
-                try:
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    loop.run_until_complete(self.progress_callback({
-                        "type": "progress",
-                        "current": 0,
-                        "total": total_songs,
-                        "message": f"Processing {total_songs} songs..."
-                    }))
-                    loop.close()
-                except Exception as e:
-                    print(f"Progress callback error: {e}")
-            threading.Thread(target=send_progress, daemon=True).start()
+        self._send_progress({
+            "type": "progress",
+            "current": 0,
+            "total": total_songs,
+            "message": f"Processing {total_songs} songs..."
+        }, job)
         
-        for i, song in enumerate(songs):
-            # Send progress update first
-            if self.progress_callback:
-                import asyncio
-                import threading
-                def send_progress():
-                    try:
-                        loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(loop)
-                        loop.run_until_complete(self.progress_callback({
-                            "type": "progress",
-                            "current": i + 1,
-                            "total": total_songs,
-                            "message": f"Processing {i + 1}/{total_songs} songs",
-                            "song_title": song.get('title', 'Unknown')
-                        }))
-                        loop.close()
-                    except Exception as e:
-                        print(f"Progress callback error: {e}")
-                threading.Thread(target=send_progress, daemon=True).start()
-            
-            # Check cache first
-            cached_info = self.yt_streamer._get_cached_metadata(song['id'])
-            if cached_info:
-                full_songs.append(cached_info)
-            else:
-                print(f"Fetching full info for new song: {song['id']}")
-                full_info = self.yt_streamer.fetch_full_song_info(song['url'])
-                if full_info:
-                    full_songs.append(full_info)
-                else:
-                    # Add basic info even if full fetch fails
-                    full_songs.append({
-                        'id': song['id'],
-                        'title': song.get('title', 'Unknown Title'),
-                        'duration': 0,
-                        'thumbnail_url': song.get('thumbnail_url')
-                    })
+        full_songs = self._fetch_songs_info(songs, "Processing", job)
+        if job:
+            job.check_cancelled()
         
         playlist_id = self.main_logic.playlist_manager.add_new_playlist(
             playlist_name, full_songs, source_url, thumbnail
         )
         
         # Send completion
-        if self.progress_callback:
-            import asyncio
-            import threading
-            def send_completion():
-                try:
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    loop.run_until_complete(self.progress_callback({
-                        "type": "complete",
-                        "message": f"Playlist '{playlist_name}' added successfully!",
-                        "playlist_id": playlist_id
-                    }))
-                    loop.close()
-                except Exception as e:
-                    print(f"Progress callback error: {e}")
-            threading.Thread(target=send_completion, daemon=True).start()
+        self._send_progress({
+            "type": "complete",
+            "message": f"Playlist '{playlist_name}' added successfully!",
+            "playlist_id": playlist_id
+        }, job)
         
         # Update UI
         self.ui.after(0, self.ui.hide_loading)
@@ -257,21 +150,106 @@ class YouTubeController:
             "Playlist Uploaded",
             f"Playlist '{playlist_name}' uploaded successfully."
         ))
+        return {"playlist_id": playlist_id, "created": True, "added": len(full_songs), "removed": 0, "total_songs": len(full_songs)}
+
+    def _fetch_songs_info(self, songs, label, job=None):
+        """
+        Resolve full metadata for playlist entries, keeping their order.
+        Songs already in the library, then cached metadata, are used first;
+        the rest are fetched from YouTube by a worker pool of at most
+        `max_concurrent_fetches` threads. Raises JobCancelled if `job` is
+        cancelled, dropping the fetches that have not started yet.
+        """
+        start_time = time.time()
+        total_songs = len(songs)
+        results = [None] * total_songs
+        pending = []
+
+        for i, song in enumerate(songs):
+            cached_info = (self.main_logic.playlist_manager.get_song(song['id'])
+                           or self.yt_streamer._get_cached_metadata(song['id']))
+            if cached_info:
+                results[i] = cached_info
+            else:
+                pending.append(i)
+
+        completed = total_songs - len(pending)
+        if completed and pending:
+            self._send_progress({
+                "type": "progress",
+                "current": completed,
+                "total": total_songs,
+                "message": f"{label} {completed}/{total_songs} songs"
+            }, job)
+
+        if pending:
+            workers = max(1, min(self.max_concurrent_fetches, len(pending)))
+            # Metadata of the whole import is persisted in one transaction at the end
+            with self.yt_streamer.batched_metadata_writes(), \
+                    ThreadPoolExecutor(max_workers=workers, thread_name_prefix="song-fetch") as executor:
+                futures = {}
+                for i in pending:
+                    print(f"Fetching full info for song: {songs[i]['id']}")
+                    futures[executor.submit(self.yt_streamer.fetch_full_song_info, songs[i]['url'])] = i
+
+                for future in as_completed(futures):
+                    if job and job.cancelled:
+                        # Only in-flight extractions are waited for
+                        executor.shutdown(wait=True, cancel_futures=True)
+                        job.check_cancelled()
+                    i = futures[future]
+                    song = songs[i]
+                    try:
+                        full_info = future.result()
+                    except Exception as e:
+                        print(f"Error fetching song {song['id']}: {e}")
+                        full_info = None
+
+                    if not full_info:
+                        # Fallback to basic info from the playlist entry
+                        full_info = {
+                            'id': song['id'],
+                            'title': song.get('title', 'Unknown Title'),
+                            'duration': 0,
+                            'thumbnail_url': song.get('thumbnail_url')
+                        }
+                    results[i] = full_info
+
+                    completed += 1
+                    self._send_progress({
+                        "type": "progress",
+                        "current": completed,
+                        "total": total_songs,
+                        "message": f"{label} {completed}/{total_songs} songs",
+                        "song_title": song.get('title', 'Unknown')
+                    }, job)
+
+        perf_logger.log_ingest_throughput(
+            label.lower(), total_songs, len(pending), time.time() - start_time
+        )
+        return results
+
+    def _send_progress(self, message, job=None):
+        """Send a progress message to `job`, else through the WebSocket callback, if set."""
+        if job:
+            job.report(message)
+            return
+        if not self.progress_callback:
+            return
+
+        def send():
+            try:
+                loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(loop)
+                loop.run_until_complete(self.progress_callback(message))
+                loop.close()
+            except Exception as e:
+                print(f"Progress callback error: {e}")
+        threading.Thread(target=send, daemon=True).start()
 
     def _update_playlist_metadata(self, playlist_id, playlist_name, thumbnail):
         """Update playlist metadata (name and thumbnail)."""
-        playlists = self.main_logic.playlist_manager.get_all_playlists()
-        if playlist_id in playlists:
-            playlist_data = playlists[playlist_id]
-            
-            if playlist_data.get("name") != playlist_name:
-                playlist_data["name"] = playlist_name
-                
-            if thumbnail and playlist_data.get("thumbnail") != thumbnail:
-                playlist_data["thumbnail"] = thumbnail
-                
-            # Save changes
-            self.main_logic.playlist_manager.save_playlists()
+        self.main_logic.playlist_manager.update_playlist_metadata(playlist_id, playlist_name, thumbnail)
 
     def _update_ui_after_playlist_sync(self, playlist_id, playlist_name, added_ids, removed_ids):
         """Update UI after playlist synchronization."""
@@ -339,23 +317,10 @@ class YouTubeController:
         if not new_songs:
             return None
             
-        new_song_ids = {song['id'] for song in new_songs if song.get('id')}
-        if not new_song_ids:
-            return None
-            
-        # Check each existing playlist for content similarity
-        for playlist_id, playlist_data in self.main_logic.playlist_manager.playlists.items():
-            existing_songs = playlist_data.get('songs', [])
-            existing_song_ids = {song['id'] for song in existing_songs if song.get('id')}
-            
-            # If 80% or more songs match, consider it a duplicate
-            if existing_song_ids and new_song_ids:
-                overlap = len(new_song_ids & existing_song_ids)
-                similarity = overlap / max(len(new_song_ids), len(existing_song_ids))
-                if similarity >= 0.8:
-                    return playlist_id
-                    
-        return None
+        # If 80% or more songs match, consider it a duplicate
+        return self.main_logic.playlist_manager.find_similar_playlist(
+            [song.get('id') for song in new_songs], threshold=0.8
+        )
 
     def _show_fetch_error(self, message):
         """Show error message for fetch failures."""
@@ -368,10 +333,7 @@ class YouTubeController:
             self.ui.show_info("Sync Error", "Please select a playlist to sync first.")
             return
 
-        playlist_data = self.main_logic.playlist_manager.get_all_playlists().get(
-            self.main_logic.current_playlist_id, {}
-        )
-        url = playlist_data.get('source_url')
+        url = self.main_logic.playlist_manager.get_playlist_url(self.main_logic.current_playlist_id)
 
         if not url:
             self.ui.show_info("Sync Error", "This playlist does not have a source YouTube URL.")
@@ -164,6 +164,10 @@ class MusicPlayerLogic:
         """Add a song to a specific playlist."""
         return self.playlist_controller.add_song_to_playlist(playlist_id, song_info)
 
+    def add_songs_to_playlist(self, playlist_id, songs):
+        """Add several songs to a playlist in one change; returns the added IDs."""
+        return self.playlist_controller.add_songs_to_playlist(playlist_id, songs)
+
     def create_new_playlist_with_song(self, name, song_info):
         """Create a new playlist with a single song."""
         playlist_id = self.playlist_controller.create_new_playlist_with_song(name, song_info)
@@ -171,6 +175,12 @@ class MusicPlayerLogic:
         self.ui.load_playlist_cards()
         return playlist_id
 
+    def create_new_playlist_with_songs(self, name, songs):
+        """Create a new playlist from several songs in one change."""
+        playlist_id = self.playlist_controller.create_new_playlist_with_songs(name, songs)
+        self.ui.load_playlist_cards()
+        return playlist_id
+
     def stop_and_cleanup(self):
         """Stop playback and clean up resources."""
         self.playback_controller.stop_and_cleanup()
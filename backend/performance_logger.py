@@ -1,6 +1,4 @@
-import json
 import time
-import os
 from datetime import datetime
 from typing import Dict, Any, Optional
 
@@ -86,7 +84,21 @@ class PerformanceLogger:
             "success_count": success_count,
             "preload_time_ms": round(preload_time * 1000, 2),
             "success_rate": round((success_count / len(video_ids) * 100), 2) if video_ids else 0,
-            "video_ids": video_ids
+            "video_ids": video_ids[:5]  # Log first 5 IDs only
+        })
+    
+    def log_ingest_throughput(self, operation: str, total_songs: int, fetched_songs: int, elapsed: float):
+        """Log playlist ingest throughput (cache hits plus parallel fetches)"""
+        self._write_log({
+            "event": "ingest_throughput",
+            "session_id": self.session_id,
+            "timestamp": datetime.now().isoformat(),
+            "operation": operation,
+            "total_songs": total_songs,
+            "fetched_songs": fetched_songs,
+            "cached_songs": total_songs - fetched_songs,
+            "elapsed_ms": round(elapsed * 1000, 2),
+            "songs_per_second": round(total_songs / elapsed, 2) if elapsed > 0 else 0
         })
     
     def log_api_request(self, endpoint: str, method: str, response_time: float, status_code: int = 200):
@@ -101,24 +113,8 @@ class PerformanceLogger:
             "status_code": status_code
         })
     
-    def log_cache_stats(self):
+    def log_cache_stats(self, url_cache_size: int = 0, metadata_cache_size: int = 0):
         """Log current cache statistics"""
-        url_cache_size = 0
-        metadata_cache_size = 0
-        
-        try:
-            if os.path.exists("song_url_cache.json"):
-                with open("song_url_cache.json", 'r') as f:
-                    url_cache = json.load(f)
-                    url_cache_size = len(url_cache)
-            
-            if os.path.exists("song_metadata_cache.json"):
-                with open("song_metadata_cache.json", 'r') as f:
-                    metadata_cache = json.load(f)
-                    metadata_cache_size = len(metadata_cache)
-        except:
-            pass
-        
         self._write_log({
             "event": "cache_stats",
             "session_id": self.session_id,
@@ -156,7 +152,8 @@ class PerformanceLogger:
                 'song_load': '🟠',
                 'playlist_refresh': '🔄',
                 'cache_operation': '💾',
-                'preload_operation': '⚡'
+                'preload_operation': '⚡',
+                'ingest_throughput': '📥'
             }
             
             indicator = color_map.get(event, '⚪')
@@ -217,6 +214,13 @@ class PerformanceLogger:
                 video_ids = log_entry.get('video_ids', [])
                 success_icon = '✨' if success_rate > 80 else '⚠️' if success_rate > 50 else '❌'
                 line = f"{indicator} [{timestamp}] PRELOAD_OPERATION - requested_count: {requested_count}, success_count: {success_count}, preload_time_ms: {preload_time}, success_rate: {success_rate}, video_ids: {video_ids} {success_icon}"
+            elif event == 'ingest_throughput':
+                operation = log_entry.get('operation', '')
+                total_songs = log_entry.get('total_songs', 0)
+                fetched_songs = log_entry.get('fetched_songs', 0)
+                elapsed = log_entry.get('elapsed_ms', 0)
+                rate = log_entry.get('songs_per_second', 0)
+                line = f"{indicator} [{timestamp}] INGEST - {operation}: {total_songs} songs ({fetched_songs} fetched) in {elapsed}ms, {rate} songs/s"
             else:
                 # Fallback for other events
                 details = ', '.join([f"{k}: {v}" for k, v in log_entry.items() if k not in ['timestamp', 'event', 'session_id']])
@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import deque
+
+
+class PlayerStateTracker:
+    """
+    Versioned player state for push updates. Each `update` with a sampled
+    state diffs it against the last one and, if anything changed, bumps the
+    version and returns only the changed fields. Recent deltas are kept so
+    a client that reconnects can catch up with `changes_since`; older
+    clients get a full `snapshot` instead.
+
+    `position` moves on every sample while playing, so it only counts as a
+    change once `position_interval` seconds have passed since it was last
+    sent, when it jumps (a seek), or alongside another change.
+    """
+
+    def __init__(self, position_interval=1.0, history=256, seek_tolerance_ms=1500):
+        self.position_interval = position_interval
+        self.seek_tolerance_ms = seek_tolerance_ms
+        self.version = 0
+        self._state = {}
+        self._history = deque(maxlen=history)  # (version, changes)
+        self._position_sent_at = 0.0
+        self._lock = threading.Lock()
+        self.updates = 0
+        self.position_ticks_dropped = 0
+
+    def _expected_position(self, now):
+        position = self._state.get("position") or 0
+        if self._state.get("is_playing") and not self._state.get("is_paused"):
+            position += (now - self._position_sent_at) * 1000
+        return position
+
+    def update(self, state, now=None):
+        """Diff a sampled state against the last one; returns the delta, or None if nothing changed."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            changes = {
+                key: value for key, value in state.items()
+                if key != "position" and self._state.get(key, object()) != value
+            }
+            position = state.get("position")
+            if position is not None and position != self._state.get("position"):
+                jumped = abs(position - self._expected_position(now)) > self.seek_tolerance_ms
+                if changes or jumped or now - self._position_sent_at >= self.position_interval:
+                    changes["position"] = position
+                else:
+                    self.position_ticks_dropped += 1
+            if not changes:
+                return None
+            if "position" in changes:
+                self._position_sent_at = now
+            self._state.update(changes)
+            self.version += 1
+            self._history.append((self.version, changes))
+            self.updates += 1
+            return changes
+
+    def snapshot(self):
+        """Return (version, full state)."""
+        with self._lock:
+            return self.version, dict(self._state)
+
+    def changes_since(self, version):
+        """
+        Return the merged changes after `version`, or None if they are no
+        longer in the history (or `version` is unknown) and a snapshot is needed.
+        """
+        with self._lock:
+            if version == self.version:
+                return {}
+            if version > self.version or not self._history or version < self._history[0][0] - 1:
+                return None
+            merged = {}
+            for entry_version, changes in self._history:
+                if entry_version > version:
+                    merged.update(changes)
+            return merged
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "updates": self.updates,
+                "position_ticks_dropped": self.position_ticks_dropped,
+                "history": len(self._history)
+            }
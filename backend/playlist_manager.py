@@ -1,157 +1,1058 @@
-import json
+import hashlib
 import os
+import re
+import threading
+import time
 import uuid
+from collections import Counter, namedtuple
+from library_index import LibraryIndex
+from playlist_journal import PlaylistJournal
+from search_index import SearchIndex
+from storage_format import available_formats, format_for_path, get_format, read_file, write_file
+from utils.text_utils import TextUtils
+from utils.persistent_map import PersistentMap
+from utils.sequence_diff import apply_edits, diff_sequences, summarize_edits
+
+SNAPSHOT_VERSION = 4
+
+# Immutable, versioned view of the library published after every mutation.
+# Readers take `manager.snapshot` once and never need a lock. `seq` only
+# moves on mutations and identifies the library's content.
+LibrarySnapshot = namedtuple("LibrarySnapshot", ["version", "seq", "playlists"])
+
+
+class PlaylistSnapshot:
+    """
+    Read-only view of one playlist; replaced, never modified, on change.
+    `version` is the seq of the last change to the playlist, so it survives
+    restarts and loading or evicting the body. `song_ids` and `songs` are
+    None while the body is not loaded.
+    """
+    __slots__ = ("id", "version", "meta", "song_ids", "songs", "song_count", "total_duration")
+
+    def __init__(self, playlist_id, version, meta, song_ids, songs, song_count=0, total_duration=0):
+        self.id = playlist_id
+        self.version = version
+        self.meta = meta  # name, source_url, thumbnail, ...
+        self.song_ids = song_ids
+        self.songs = songs
+        if songs is not None:
+            song_count = len(song_ids)
+            total_duration = sum(song.get("duration") or 0 for song in songs)
+        self.song_count = song_count
+        self.total_duration = total_duration
+
+    @property
+    def loaded(self):
+        return self.song_ids is not None
+
+
+_EMPTY_PLAYLIST = PlaylistSnapshot(None, 0, {}, (), ())
+_SAFE_ID_RE = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+# Ops that change a playlist's body (its song list) rather than its metadata
+_BODY_OPS = ("add_song", "remove_song", "set_songs", "splice_songs")
+
+
+def song_key(song):
+    """Key of a song in the song table: its video ID (or URL for legacy entries)."""
+    return song.get("id") or song.get("url")
+
+
+def shard_name(playlist_id):
+    """File name (without suffix) of a playlist's shard."""
+    if _SAFE_ID_RE.fullmatch(playlist_id):
+        return playlist_id
+    return "pl-" + hashlib.sha1(playlist_id.encode('utf-8')).hexdigest()
+
 
 class PlaylistManager:
     """
     Manages multiple playlists, including adding, removing, and saving.
+
+    The library is stored as a small manifest (playlist metadata and song
+    counts) plus one shard per playlist holding its ordered `song_ids` and
+    song dicts, in a directory next to `filename`. Startup reads only the
+    manifest; a playlist's body is loaded the first time it is read and
+    evicted again once idle for `idle_timeout` seconds. Songs of loaded
+    playlists share one table keyed by video ID (`songs`). New metadata for
+    a song travels in the journal record of the write that brought it and
+    bumps the version of every playlist holding the song; unloaded ones get
+    the new copy from the library index when next loaded.
+
+    Mutations are appended to a journal (O(change) per write); a background
+    thread compacts it every `compact_interval` seconds or after
+    `compact_after` records by rewriting the shards that changed and the
+    manifest. Files are written in `storage_format` (the best installed one
+    by default, see storage_format.py); older layouts and formats are
+    migrated on load.
+
+    Lookups across the whole library (duplicate detection, the playlists
+    holding a song, metadata of songs in unloaded playlists) go through a
+    persisted `LibraryIndex` that every mutation updates in O(change) and
+    each compaction writes out, so they never read shards. It is rebuilt
+    from the shards only if it is missing or older than the manifest.
+
+    Writers hold a per-playlist lock across check-then-write sequences and
+    the commit lock only while a record is applied in memory; fsyncs happen
+    outside it, so imports into different playlists proceed in parallel.
+    Readers use the copy-on-write `snapshot` and never block.
     """
-    def __init__(self, filename="playlists.json"):
+    def __init__(self, filename="playlists.json", compact_after=500, compact_interval=300,
+                 clean_search_titles=True, storage_format=None, idle_timeout=600):
         self.filename = filename
-        self.playlists = self.load_playlists()
+        self.storage_format = get_format(storage_format)
+        self.directory = os.path.splitext(filename)[0]
+        self.manifest_path = os.path.join(self.directory, "manifest" + self.storage_format.suffix)
+        self.compact_after = compact_after
+        self.compact_interval = compact_interval
+        self.idle_timeout = idle_timeout
+        self.journal = PlaylistJournal(filename + ".journal")
+        self._lock = threading.RLock()  # Commit lock: internal state, indexes, publishing
+        self._playlist_locks = {}
+        self._playlist_locks_guard = threading.Lock()
+        self._create_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._compact_event = threading.Event()
+        self._compactor = None
+        self._closed = False
+        self._seq = 0
+        self.playlists = {}     # playlist_id -> metadata, for every playlist
+        self._stats = {}        # playlist_id -> (song_count, total_duration) from the last load or publish
+        self._versions = {}     # playlist_id -> seq of its last change
+        self._bodies = {}       # playlist_id -> ordered song_ids, for loaded playlists
+        self._shard_seq = {}    # playlist_id -> seq its shard on disk was written at
+        self._last_used = {}    # playlist_id -> monotonic time its body was last touched
+        self._dirty = set()     # Loaded playlists whose shard is out of date
+        self._deleted = set()   # Playlists whose shard should be removed at the next compaction
+        self.songs = {}
+        self._song_refs = Counter()  # video_id -> loaded playlists holding it
+        self._restamped = set()  # Shared song rows replaced with new metadata by the record being applied
+        self.search_index = SearchIndex(TextUtils().clean_song_title if clean_search_titles else None)
+        self._search_ready = False
+        self._song_ids = {}
+        self._url_index = {}
+        self._name_index = {}
+        self._replaying = False
+        self._migrate_from = None
+        os.makedirs(self.directory, exist_ok=True)
+        self.index = LibraryIndex(os.path.join(self.directory, "library.db"))
+        self.load_playlists()
+        if self.index.seq is None or self.index.seq < self._seq:
+            self._rebuild_index()
+        replayed = self._replay_journal()
+        self.snapshot = LibrarySnapshot(0, self._seq, PersistentMap())
+        self._publish()
+        if replayed or self._migrate_from:
+            self.save_playlists()
+        if self._migrate_from:
+            self._retire_file(self._migrate_from)
+
+    # Storage
+    def _other_formats(self):
+        return [fmt for fmt in available_formats() if fmt.name != self.storage_format.name]
+
+    def _shard_paths(self, playlist_id):
+        """Possible shard files of a playlist, in our format first."""
+        base = os.path.join(self.directory, shard_name(playlist_id))
+        return [base + fmt.suffix for fmt in [self.storage_format] + self._other_formats()]
+
+    def _read_shard(self, playlist_id):
+        for path in self._shard_paths(playlist_id):
+            if os.path.exists(path):
+                try:
+                    return read_file(path)
+                except Exception as e:
+                    print(f"Error reading playlist shard {path}: {e}")
+                    return None
+        return None
+
+    def _legacy_candidates(self):
+        """Single-file snapshots written before shards: any installed format, then `filename`."""
+        base = os.path.splitext(self.filename)[0]
+        paths = [base + fmt.suffix for fmt in available_formats()]
+        paths.append(self.filename)
+        return list(dict.fromkeys(paths))
 
     def load_playlists(self):
-        if os.path.exists(self.filename):
+        """
+        Load the manifest into `playlists`, leaving every body on disk. A
+        manifest in another format, or a single-file snapshot from before
+        shards, is loaded the same way and marked for migration.
+        """
+        manifests = [self.manifest_path]
+        manifests += [os.path.join(self.directory, "manifest" + fmt.suffix) for fmt in self._other_formats()]
+        path = next((p for p in manifests if os.path.exists(p)), None)
+        if path is not None:
             try:
-                with open(self.filename, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except (json.JSONDecodeError, FileNotFoundError):
-                return {}
-        return {}
+                data = read_file(path)
+            except Exception as e:
+                print(f"Error reading playlist manifest {path}: {e}")
+                return self.playlists
+            if path != self.manifest_path:
+                self._migrate_from = path
+            self._seq = data.get("seq", 0)
+            for playlist_id, entry in data.get("playlists", {}).items():
+                self.playlists[playlist_id] = entry["meta"]
+                self._stats[playlist_id] = (entry.get("song_count", 0), entry.get("total_duration", 0))
+                self._versions[playlist_id] = entry.get("version", 0)
+                self._index_meta(playlist_id, entry["meta"])
+            return self.playlists
+
+        path = next((p for p in self._legacy_candidates() if os.path.exists(p)), None)
+        if path is not None:
+            self._load_legacy_snapshot(path)
+        return self.playlists
+
+    def _load_legacy_snapshot(self, path):
+        """
+        Load a whole-library snapshot (version 3 or older) with every body
+        resident and dirty, so the next compaction writes it out as shards.
+        Older layouts (a bare {id: playlist} dict, or version 2 with
+        embedded song dicts) are normalized on load.
+        """
+        try:
+            data = read_file(path, format_for_path(path) or get_format("json"))
+        except Exception as e:
+            print(f"Error reading playlist snapshot {path}: {e}")
+            return
+        self._migrate_from = path
+        if isinstance(data, dict) and "version" in data and "playlists" in data:
+            self._seq = data.get("seq", 0)
+            self.songs = data.get("songs", {})
+            playlists = data["playlists"]
+        else:
+            playlists = data
+        for playlist_id, playlist in playlists.items():
+            if "songs" in playlist:
+                song_ids = self._store_songs(playlist.pop("songs"))
+            else:
+                song_ids = playlist.pop("song_ids", [])
+            self.playlists[playlist_id] = playlist
+            self._index_meta(playlist_id, playlist)
+            self._attach(playlist_id, song_ids)
+            self._dirty.add(playlist_id)
+        for key in [k for k in self.songs if k not in self._song_refs]:
+            del self.songs[key]
+
+    def _retire_file(self, path):
+        """Rename a file that was migrated to the current layout so it is never loaded again."""
+        try:
+            os.replace(path, path + ".migrated")
+            print(f"Migrated playlists from {path} to {self.directory}")
+        except OSError as e:
+            print(f"Error renaming migrated playlists {path}: {e}")
+
+    def _replay_journal(self):
+        """Apply journal records newer than the manifest; returns how many were applied."""
+        applied = 0
+        self._replaying = True
+        try:
+            for record in self.journal.read():
+                if record.get("seq", 0) > self._seq:
+                    self._apply(record)
+                    applied += 1
+        finally:
+            self._replaying = False
+        if applied:
+            print(f"Recovered {applied} playlist change(s) from the journal")
+        return applied
 
     def save_playlists(self):
-        with open(self.filename, 'w', encoding='utf-8') as f:
-            json.dump(self.playlists, f, indent=4, ensure_ascii=False)
+        """
+        Write the shards of changed playlists, then the manifest, and drop
+        the journal records they cover. Playlists that did not change are
+        not rewritten.
+        """
+        with self._compact_lock:
+            if self._closed:
+                return  # A background compaction that lost the race with close()
+            with self._lock:
+                snapshot = self.snapshot
+                dirty, self._dirty = self._dirty, set()
+                deleted, self._deleted = self._deleted, set()
+                self.journal.rotate()
+                self.index.freeze()
+            # Serialized from the published snapshot, so writers are not held up
+            try:
+                # The index goes first: shards newer than it would hide changes from replay
+                self.index.write(snapshot.seq)
+                for playlist_id in dirty:
+                    playlist = snapshot.playlists.get(playlist_id)
+                    if playlist is not None and playlist.loaded:
+                        self._write_shard(playlist, snapshot.seq)
+                write_file(self.manifest_path, {
+                    "version": SNAPSHOT_VERSION,
+                    "seq": snapshot.seq,
+                    "playlists": {
+                        playlist_id: {
+                            "meta": playlist.meta,
+                            "song_count": playlist.song_count,
+                            "total_duration": playlist.total_duration,
+                            "version": playlist.version
+                        }
+                        for playlist_id, playlist in snapshot.playlists.items()
+                    }
+                }, self.storage_format)
+            except BaseException:
+                with self._lock:
+                    self._dirty |= dirty
+                    self._deleted |= deleted
+                raise
+            for playlist_id in deleted:
+                if playlist_id not in snapshot.playlists:
+                    self._remove_shard(playlist_id)
+            self.journal.discard_rotated()
+
+    def _write_shard(self, playlist, seq):
+        paths = self._shard_paths(playlist.id)
+        write_file(paths[0], {
+            "version": SNAPSHOT_VERSION,
+            "id": playlist.id,
+            "seq": seq,
+            "song_ids": list(playlist.song_ids),
+            "songs": dict(zip(playlist.song_ids, playlist.songs))
+        }, self.storage_format)
+        for path in paths[1:]:
+            if os.path.exists(path):
+                os.remove(path)  # Same shard in a format we no longer write
+        with self._lock:
+            self._shard_seq[playlist.id] = max(self._shard_seq.get(playlist.id, 0), seq)
+
+    def _remove_shard(self, playlist_id):
+        for path in self._shard_paths(playlist_id):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                print(f"Error removing playlist shard {path}: {e}")
+
+    # Mutations
+    def _playlist_lock(self, playlist_id):
+        with self._playlist_locks_guard:
+            lock = self._playlist_locks.get(playlist_id)
+            if lock is None:
+                lock = self._playlist_locks[playlist_id] = threading.RLock()
+            return lock
+
+    def _commit(self, record, songs=None):
+        """
+        Journal a mutation, apply it and publish a new snapshot; returns once
+        the record is on disk. `songs` are added to the record as the ones
+        the playlist doesn't already hold verbatim.
+        """
+        with self._lock:
+            if songs is not None:
+                record["songs"] = self._changed_songs(songs, record.get("id"))
+            self._seq += 1
+            record["seq"] = self._seq
+            position = self.journal.write(record)
+            self._publish(self._apply(record))
+        self.journal.sync(position)
+        self._start_compactor()
+        if self.journal.records >= self.compact_after:
+            self._compact_event.set()
+
+    def _apply(self, record):
+        """Apply a record to the internal state; returns the affected playlist IDs."""
+        op = record["op"]
+        playlist_id = record.get("id")
+        seq = record["seq"]
+        affected = {playlist_id}
+        changed = {playlist_id}
+        self._restamped.clear()
+        if op == "create_playlist":
+            if playlist_id in self.playlists:
+                self._drop_playlist(playlist_id)
+            playlist = dict(record["playlist"])
+            legacy_songs = playlist.pop("songs", None)  # Journal written before the song table existed
+            song_ids = playlist.pop("song_ids", [])
+            self.playlists[playlist_id] = playlist
+            self._index_meta(playlist_id, playlist)
+            shard = self._read_shard(playlist_id) if self._replaying else None
+            if shard is not None and shard.get("seq", 0) >= seq:
+                self._attach_shard(playlist_id, shard)  # Written by a compaction that did not finish
+            else:
+                if legacy_songs is not None:
+                    song_ids = self._store_songs(legacy_songs)
+                self._store_songs(record.get("songs", {}).values())
+                self._shard_seq[playlist_id] = 0
+                self._attach(playlist_id, song_ids)
+                self._dirty.add(playlist_id)
+            self.index.reset_playlist(playlist_id, self._song_ids[playlist_id])
+        elif playlist_id not in self.playlists:
+            changed = set()
+        elif op == "delete_playlist":
+            self._drop_playlist(playlist_id)
+            changed = set()
+        elif op in _BODY_OPS:
+            song_ids = self._body(playlist_id)
+            if seq > self._shard_seq.get(playlist_id, 0):  # Otherwise the shard already has it
+                self._apply_body(record, song_ids)
+                self._dirty.add(playlist_id)
+        elif op == "update_meta":
+            playlist = self.playlists[playlist_id]
+            for key, value in record["fields"].items():
+                if key == "name":
+                    self._index_remove(self._name_index, playlist.get("name"), playlist_id)
+                    self._index_add(self._name_index, value, playlist_id)
+                playlist[key] = value
+        if self._restamped:
+            # Every playlist sharing a replaced row shows (and stores) the new metadata
+            holders = self._holders(self._restamped)
+            self._restamped.clear()
+            affected |= holders
+            changed |= holders
+            self._dirty.update(holder for holder in holders if holder in self._bodies)
+        for changed_id in changed:
+            self._versions[changed_id] = seq
+        self._seq = max(self._seq, seq)
+        return affected
+
+    def _apply_body(self, record, song_ids):
+        op = record["op"]
+        playlist_id = record["id"]
+        if op == "add_song":
+            key = self._store_songs([record["song"]])[0]
+            song_ids.append(key)
+            self._index_songs(playlist_id, [key])
+        elif op == "remove_song":
+            removed = song_ids.pop(record["index"])
+            self._unindex_song(playlist_id, removed)
+        elif op == "set_songs":
+            songs = record["songs"]
+            if isinstance(songs, list):  # Journal written before the song table existed
+                new_ids = self._store_songs(songs)
+            else:
+                self._store_songs(songs.values())
+                new_ids = record["song_ids"]
+            old_ids = list(song_ids)
+            song_ids[:] = new_ids
+            # Index before unindexing so kept songs are never dropped
+            self._index_songs(playlist_id, new_ids)
+            for key in old_ids:
+                self._unindex_song(playlist_id, key)
+        elif op == "splice_songs":
+            self._store_songs(record["songs"].values())
+            removed = [key for start, end, _ in record["edits"] for key in song_ids[start:end]]
+            inserted = [key for _, _, replacement in record["edits"] for key in replacement]
+            apply_edits(song_ids, record["edits"])
+            self._index_songs(playlist_id, inserted)
+            for key in removed:
+                self._unindex_song(playlist_id, key)
+
+    def _holders(self, keys):
+        """Playlists, loaded or not, holding any of `keys`."""
+        return {playlist_id for holders in self.index.holders_many(keys).values() for playlist_id in holders}
+
+    def _drop_playlist(self, playlist_id):
+        self._detach(playlist_id)
+        self._unindex_meta(playlist_id)
+        self._unindex_songs(playlist_id)
+        del self.playlists[playlist_id]
+        for state in (self._stats, self._versions, self._shard_seq, self._last_used):
+            state.pop(playlist_id, None)
+        self._dirty.discard(playlist_id)
+        self._deleted.add(playlist_id)
+
+    def _publish(self, playlist_ids=None):
+        """
+        Swap in a new snapshot with the given playlists (default: all)
+        rebuilt; every other playlist is shared with the previous snapshot,
+        so a change costs O(log n) in the number of playlists.
+        """
+        version = self.snapshot.version + 1
+        if playlist_ids is None:
+            self.snapshot = LibrarySnapshot(version, self._seq, PersistentMap(
+                (playlist_id, self._playlist_snapshot(playlist_id)) for playlist_id in self.playlists
+            ))
+            return
+        playlists = self.snapshot.playlists
+        for playlist_id in playlist_ids:
+            if playlist_id not in self.playlists:
+                playlists = playlists.delete(playlist_id)
+            else:
+                playlists = playlists.set(playlist_id, self._playlist_snapshot(playlist_id))
+        self.snapshot = LibrarySnapshot(version, self._seq, playlists)
+
+    def _playlist_snapshot(self, playlist_id):
+        meta = self.playlists[playlist_id]
+        version = self._versions.get(playlist_id, 0)
+        body = self._bodies.get(playlist_id)
+        if body is None:
+            count, duration = self._stats.get(playlist_id, (0, 0))
+            return PlaylistSnapshot(playlist_id, version, dict(meta), None, None, count, duration)
+        song_ids = tuple(body)
+        playlist = PlaylistSnapshot(playlist_id, version, dict(meta), song_ids,
+                                    tuple(self.songs[key] for key in song_ids))
+        self._stats[playlist_id] = (playlist.song_count, playlist.total_duration)
+        return playlist
+
+    def _start_compactor(self):
+        if self._compactor and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self._compact_loop, daemon=True)
+        self._compactor.start()
+
+    def _compact_loop(self):
+        while True:
+            self._compact_event.wait(min(self.compact_interval, self.idle_timeout))
+            self._compact_event.clear()
+            if self._closed:
+                return
+            if self.journal.has_pending():
+                try:
+                    self.save_playlists()
+                except OSError as e:
+                    print(f"Error compacting playlist journal: {e}")
+            self.evict_idle_playlists()
+
+    def evict_idle_playlists(self, idle_timeout=None):
+        """
+        Unload the bodies of playlists not touched for `idle_timeout`
+        seconds (default: the manager's) whose shard is up to date.
+        Returns how many were unloaded.
+        """
+        cutoff = time.monotonic() - (self.idle_timeout if idle_timeout is None else idle_timeout)
+        evicted = 0
+        with self._compact_lock:  # A compaction in progress may still be writing their shards
+            for playlist_id in list(self._bodies):
+                if self._last_used.get(playlist_id, 0) > cutoff:
+                    continue
+                lock = self._playlist_lock(playlist_id)
+                if not lock.acquire(blocking=False):
+                    continue  # A writer is using it
+                try:
+                    with self._lock:
+                        if playlist_id in self._bodies and playlist_id not in self._dirty:
+                            self._detach(playlist_id)
+                            self._publish([playlist_id])
+                            evicted += 1
+                finally:
+                    lock.release()
+        return evicted
+
+    def close(self):
+        """Compact outstanding journal records (e.g. on shutdown)."""
+        if self.journal.has_pending() or self._dirty:
+            self.save_playlists()
+        with self._compact_lock:
+            self._closed = True
+            self.journal.close()
+            self.index.close()
+
+    # Playlist bodies
+    def _attach(self, playlist_id, song_ids, songs=None):
+        """
+        Make a playlist body resident. Songs the song table doesn't hold
+        come from the library index, which has the latest metadata, and
+        only then from `songs` ({key: song}, e.g. from its shard); a shard
+        with outdated copies is rewritten at the next compaction.
+        """
+        self._bodies[playlist_id] = list(song_ids)
+        self._last_used[playlist_id] = time.monotonic()
+        counts = self._song_ids[playlist_id] = Counter(key for key in song_ids if key)
+        current = self.index.songs_many(key for key in counts if key not in self.songs)
+        for key in counts:
+            self._hold_song(key, current.get(key) or (songs.get(key) if songs else None))
+            if songs and key in songs and songs[key] != self.songs[key]:
+                self._dirty.add(playlist_id)  # Bring its shard up to date at the next compaction
+                self._versions[playlist_id] = self._seq
+
+    def _attach_shard(self, playlist_id, shard):
+        if shard is None:
+            print(f"Playlist shard for {playlist_id} is missing; loading it empty")
+            shard = {}
+        self._shard_seq[playlist_id] = shard.get("seq", 0)
+        self._attach(playlist_id, shard.get("song_ids", []), shard.get("songs", {}))
+
+    def _detach(self, playlist_id):
+        """Unload a playlist body."""
+        if self._bodies.pop(playlist_id, None) is None:
+            return
+        for key in self._song_ids.pop(playlist_id):
+            self._release_song(key)
+
+    def _body(self, playlist_id):
+        """The mutable song_ids list of a playlist, loading it if needed (commit lock held)."""
+        body = self._bodies.get(playlist_id)
+        if body is None:
+            self._attach_shard(playlist_id, self._read_shard(playlist_id))
+            body = self._bodies[playlist_id]
+        self._last_used[playlist_id] = time.monotonic()
+        return body
+
+    def _loaded_snapshot(self, playlist_id):
+        """Snapshot of a playlist with its body loaded; the shard is read outside the commit lock."""
+        playlist = self.snapshot.playlists.get(playlist_id)
+        if playlist is None:
+            return _EMPTY_PLAYLIST
+        if not playlist.loaded:
+            with self._playlist_lock(playlist_id):
+                if not self.snapshot.playlists.get(playlist_id, _EMPTY_PLAYLIST).loaded:
+                    shard = self._read_shard(playlist_id)
+                    with self._lock:
+                        if playlist_id in self.playlists and playlist_id not in self._bodies:
+                            self._attach_shard(playlist_id, shard)
+                            self._publish([playlist_id])
+            self._start_compactor()  # Also evicts it again once idle
+            playlist = self.snapshot.playlists.get(playlist_id, _EMPTY_PLAYLIST)
+        self._last_used[playlist_id] = time.monotonic()
+        return playlist
+
+    # Song table helpers
+    def _store_songs(self, songs):
+        """
+        Insert or replace songs in the song table; returns their keys in
+        order. Rows that differ from the library's copy, loaded or not, are
+        noted in `_restamped` for `_apply`.
+        """
+        songs = list(songs)
+        stored = self.index.songs_many(song_key(s) for s in songs if song_key(s) not in self.songs)
+        keys = []
+        for song in songs:
+            key = song_key(song)
+            if key is None:
+                key = f"local:{uuid.uuid4()}"
+                song = dict(song, id=key)
+            previous = self.songs.get(key) or stored.get(key)
+            if previous is not None and previous != song:
+                self._restamped.add(key)
+            self.songs[key] = song
+            self.index.put_song(key, song)
+            if self._search_ready:
+                self.search_index.add(key, song.get("title"))
+            keys.append(key)
+        return keys
+
+    @staticmethod
+    def _keyed(songs):
+        """Give songs without a video ID or URL a local key so they can be stored."""
+        return [s if song_key(s) else dict(s, id=f"local:{uuid.uuid4()}") for s in songs]
+
+    def _changed_songs(self, songs, playlist_id=None):
+        """
+        Return {key: song} for songs the playlist doesn't already hold
+        verbatim; the journal must be replayable with only that playlist loaded.
+        """
+        held = self._song_ids.get(playlist_id, ()) if playlist_id in self._bodies else ()
+        return {
+            song_key(s): s for s in songs
+            if song_key(s) and (song_key(s) not in held or self.songs.get(song_key(s)) != s)
+        }
+
+    def _hold_song(self, key, song=None):
+        """Count a loaded playlist holding `key`, loading `song` if the table lacks it."""
+        self._song_refs[key] += 1
+        if key not in self.songs:
+            if song is not None:
+                self.songs[key] = song
+            else:
+                # Dropped from the library after the caller diffed, or lost from a shard
+                self._store_songs([{"id": key, "title": "Unknown Title", "duration": 0}])
+
+    def _release_song(self, key):
+        self._song_refs[key] -= 1
+        if self._song_refs[key] <= 0:
+            del self._song_refs[key]
+            self.songs.pop(key, None)
+
+    # Secondary indexes, kept in sync by every mutation under the commit lock:
+    #   _song_ids:    playlist_id -> Counter of video IDs, for loaded playlists
+    #   index:        video_id -> playlists holding it, and every song's
+    #                 metadata, for the whole library (see LibraryIndex)
+    #   _url_index:   source_url -> {playlist_id: None}, in insertion order
+    #   _name_index:  name -> {playlist_id: None}, in insertion order
+    def _rebuild_index(self):
+        """
+        Rebuild the library index from every shard. Only needed when it is
+        missing or older than the manifest, e.g. on the first start after
+        upgrading; every later change updates it incrementally.
+        """
+        def playlists():
+            for playlist_id in list(self.playlists):
+                if playlist_id in self._bodies:
+                    song_ids = self._bodies[playlist_id]
+                    yield playlist_id, song_ids, {key: self.songs[key] for key in song_ids if key in self.songs}
+                else:
+                    shard = self._read_shard(playlist_id) or {}
+                    yield playlist_id, shard.get("song_ids", []), shard.get("songs", {})
+        self.index.rebuild(playlists(), self._seq)
+
+    def _index_titles(self):
+        """Index every song title in the library for search; read from the library index, not shards."""
+        if self._search_ready:
+            return
+        for key, song in self.index.iter_songs():
+            self.search_index.add(key, (self.songs.get(key) or song).get("title"))
+        self._search_ready = True
+
+    @staticmethod
+    def _index_add(index, key, playlist_id):
+        if key:
+            index.setdefault(key, {})[playlist_id] = None
+
+    @staticmethod
+    def _index_remove(index, key, playlist_id):
+        members = index.get(key)
+        if members is not None:
+            members.pop(playlist_id, None)
+            if not members:
+                del index[key]
+
+    def _index_meta(self, playlist_id, playlist):
+        self._index_add(self._url_index, playlist.get("source_url"), playlist_id)
+        self._index_add(self._name_index, playlist.get("name"), playlist_id)
+
+    def _unindex_meta(self, playlist_id):
+        playlist = self.playlists.get(playlist_id, {})
+        self._index_remove(self._url_index, playlist.get("source_url"), playlist_id)
+        self._index_remove(self._name_index, playlist.get("name"), playlist_id)
+
+    def _index_songs(self, playlist_id, song_ids):
+        """Count songs added to a loaded playlist's body."""
+        counts = self._song_ids[playlist_id]
+        for video_id in song_ids:
+            if video_id:
+                counts[video_id] += 1
+                if counts[video_id] == 1:
+                    self._hold_song(video_id)
+                    self.index.add(video_id, playlist_id)
+
+    def _unindex_song(self, playlist_id, video_id):
+        counts = self._song_ids.get(playlist_id)
+        if not counts or not video_id:
+            return
+        counts[video_id] -= 1
+        if counts[video_id] <= 0:
+            del counts[video_id]
+            self._release_song(video_id)
+            self.index.remove(video_id, playlist_id)
+            self._drop_if_orphaned(video_id)
+
+    def _unindex_songs(self, playlist_id):
+        """Forget a (detached) playlist's songs in the library-wide indexes."""
+        keys = self.index.playlist_songs(playlist_id) if self._search_ready else ()
+        self.index.reset_playlist(playlist_id)
+        for key in keys:
+            self._drop_if_orphaned(key)
+
+    def _drop_if_orphaned(self, key):
+        if self._search_ready and not self.index.holders(key):
+            self.search_index.remove(key)
 
     def add_new_playlist(self, name, songs, source_url=None, thumbnail=None):
         playlist_id = str(uuid.uuid4())
-        self.playlists[playlist_id] = {
-            "name": name,
-            "songs": songs,
-            "source_url": source_url,
-            "thumbnail": thumbnail  # Store the thumbnail URL or local path here
-        }
-        self.save_playlists()
+        songs = self._keyed(songs)
+        self._commit({
+            "op": "create_playlist",
+            "id": playlist_id,
+            "playlist": {
+                "name": name,
+                "song_ids": [song_key(s) for s in songs],
+                "source_url": source_url,
+                "thumbnail": thumbnail  # Store the thumbnail URL or local path here
+            }
+        }, songs=songs)
         return playlist_id
 
     def remove_playlist(self, playlist_id):
-        if playlist_id in self.playlists:
-            del self.playlists[playlist_id]
-            self.save_playlists()
+        with self._playlist_lock(playlist_id):
+            if self.has_playlist(playlist_id):
+                self._commit({"op": "delete_playlist", "id": playlist_id})
 
     def add_song_to_playlist(self, playlist_id, song_info):
-        if playlist_id in self.playlists:
-            # Check if the song already exists (compare by video ID or URL)
-            existing = self.playlists[playlist_id]["songs"]
-            if any(s.get("id") == song_info.get("id") for s in existing):
-                return False  # ❌ Song already exists
-
-            # Otherwise, add it
-            self.playlists[playlist_id]["songs"].append(song_info)
-            self.save_playlists()
-            return True
-        return False  # Playlist doesn't exist
+        with self._playlist_lock(playlist_id):
+            if self.has_playlist(playlist_id):
+                # Check if the song already exists (compare by video ID)
+                if self.song_exists(playlist_id, song_info.get("id")):
+                    return False  # ❌ Song already exists
+
+                # Otherwise, add it
+                self._commit({"op": "add_song", "id": playlist_id, "song": self._keyed([song_info])[0]})
+                return True
+            return False  # Playlist doesn't exist
+
+    def add_songs_to_playlist(self, playlist_id, songs):
+        """
+        Append the songs a playlist doesn't hold yet, in order, as a single
+        change. Returns the added song IDs, or None if the playlist doesn't exist.
+        """
+        songs = self._keyed(songs)
+        with self._playlist_lock(playlist_id):
+            if not self.has_playlist(playlist_id):
+                return None
+            old_ids = self._loaded_snapshot(playlist_id).song_ids
+            seen = set(old_ids)
+            added = []
+            for song in songs:
+                if song_key(song) not in seen:
+                    seen.add(song_key(song))
+                    added.append(song)
+            if added:
+                end = len(old_ids)
+                self._commit({
+                    "op": "splice_songs",
+                    "id": playlist_id,
+                    "edits": [[end, end, [song_key(s) for s in added]]]
+                }, songs=added)
+            return [song_key(s) for s in added]
 
     def remove_song_from_playlist(self, playlist_id, song_index):
-        if playlist_id in self.playlists and 0 <= song_index < len(self.playlists[playlist_id]['songs']):
-            del self.playlists[playlist_id]['songs'][song_index]
-            self.save_playlists()
+        with self._playlist_lock(playlist_id):
+            if self.has_playlist(playlist_id) and 0 <= song_index < self.get_song_count(playlist_id):
+                self._loaded_snapshot(playlist_id)
+                self._commit({"op": "remove_song", "id": playlist_id, "index": song_index})
 
     def update_playlist_songs(self, playlist_id, new_songs):
-        if playlist_id in self.playlists:
-            self.playlists[playlist_id]['songs'] = new_songs
-            self.save_playlists()
-    
+        new_songs = self._keyed(new_songs)
+        with self._playlist_lock(playlist_id):
+            if self.has_playlist(playlist_id):
+                self._loaded_snapshot(playlist_id)
+                # Only songs the playlist doesn't already hold verbatim go into the record
+                self._commit({
+                    "op": "set_songs",
+                    "id": playlist_id,
+                    "song_ids": [song_key(s) for s in new_songs]
+                }, songs=new_songs)
+
+    def sync_playlist_songs(self, playlist_id, song_ids, new_songs=()):
+        """
+        Reorder a playlist to match `song_ids`, persisting only the ordered
+        diff (inserts, deletes and moves) against the stored order.
+        `new_songs` supplies metadata for IDs not already in the library.
+        Returns (added_ids, removed_ids, moved_ids), or None if the playlist
+        doesn't exist.
+        """
+        new_songs = self._keyed(new_songs)
+        with self._playlist_lock(playlist_id):
+            if not self.has_playlist(playlist_id):
+                return None
+            old_ids = self._loaded_snapshot(playlist_id).song_ids
+            edits = diff_sequences(old_ids, list(song_ids))
+            if edits:
+                self._commit({"op": "splice_songs", "id": playlist_id, "edits": edits}, songs=new_songs)
+            return summarize_edits(old_ids, edits)
+
+    def update_playlist_metadata(self, playlist_id, name=None, thumbnail=None):
+        """Update a playlist's name and/or thumbnail; returns True if anything changed."""
+        with self._playlist_lock(playlist_id):
+            playlist = self.snapshot.playlists.get(playlist_id)
+            if playlist is None:
+                return False
+
+            fields = {}
+            if name and playlist.meta.get("name") != name:
+                fields["name"] = name
+            if thumbnail and playlist.meta.get("thumbnail") != thumbnail:
+                fields["thumbnail"] = thumbnail
+
+            if fields:
+                self._commit({"op": "update_meta", "id": playlist_id, "fields": fields})
+            return bool(fields)
+
     def update_playlist_thumbnail(self, playlist_id, thumbnail_path):
         """Updates the thumbnail for a specific playlist."""
-        if playlist_id in self.playlists:
-            self.playlists[playlist_id]['thumbnail'] = thumbnail_path
-            self.save_playlists()
-            
+        with self._playlist_lock(playlist_id):
+            if self.has_playlist(playlist_id):
+                self._commit({"op": "update_meta", "id": playlist_id, "fields": {"thumbnail": thumbnail_path}})
+
     def remove_playlist_thumbnail(self, playlist_id):
         """Removes the custom thumbnail from a playlist."""
-        if playlist_id in self.playlists and 'thumbnail' in self.playlists[playlist_id]:
-            self.playlists[playlist_id]['thumbnail'] = self.playlists[playlist_id].get('source_thumbnail', None)
-            self.save_playlists()
-            
+        with self._playlist_lock(playlist_id):
+            playlist = self.snapshot.playlists.get(playlist_id)
+            if playlist is not None and 'thumbnail' in playlist.meta:
+                source_thumbnail = playlist.meta.get('source_thumbnail', None)
+                self._commit({"op": "update_meta", "id": playlist_id, "fields": {"thumbnail": source_thumbnail}})
+
+    # Readers: everything below reads one published snapshot or the library
+    # index and takes no lock, except lookups through the in-memory secondary
+    # indexes, which hold the commit lock only for the lookup itself, and the
+    # first read of an unloaded body.
+    def _meta_of(self, playlist_id):
+        """Snapshot of a playlist whose body may not be loaded; for metadata and counts."""
+        return self.snapshot.playlists.get(playlist_id, _EMPTY_PLAYLIST)
+
     def get_playlist_thumbnail(self, playlist_id):
         """Returns the custom or YouTube thumbnail for the playlist."""
-        return self.playlists.get(playlist_id, {}).get('thumbnail')
+        return self._meta_of(playlist_id).meta.get('thumbnail')
 
     def get_first_song_thumbnail(self, playlist_id):
-        if playlist_id in self.playlists and self.playlists[playlist_id]['songs']:
-            return self.playlists[playlist_id]['songs'][0].get('thumbnail_url')
+        songs = self._loaded_snapshot(playlist_id).songs
+        if songs:
+            return songs[0].get('thumbnail_url')
         return None
 
+    def get_song(self, video_id):
+        """Returns the stored song dict for a video ID, or None."""
+        song = self.songs.get(video_id)
+        if song is None and video_id:
+            song = self.index.song(video_id)  # Held by unloaded playlists only
+        return song
+
+    def get_song_ids(self, playlist_id):
+        return list(self._loaded_snapshot(playlist_id).song_ids)
+
+    def get_song_count(self, playlist_id):
+        return self._meta_of(playlist_id).song_count
+
     def get_songs(self, playlist_id):
-        return self.playlists.get(playlist_id, {}).get('songs', [])
+        return list(self._loaded_snapshot(playlist_id).songs)
+
+    def get_songs_page(self, playlist_id, offset=0, limit=None):
+        """Returns (songs in the window, total song count) for a playlist."""
+        songs = self._loaded_snapshot(playlist_id).songs
+        end = len(songs) if limit is None else offset + limit
+        return list(songs[offset:end]), len(songs)
+
+    @staticmethod
+    def _summary(playlist):
+        return {
+            "id": playlist.id,
+            "name": playlist.meta.get("name"),
+            "thumbnail": playlist.meta.get("thumbnail"),
+            "source_url": playlist.meta.get("source_url"),
+            "song_count": playlist.song_count,
+            "total_duration": playlist.total_duration
+        }
+
+    def get_playlist_summary(self, playlist_id):
+        """Returns id, name, thumbnail, source URL, song count and total duration."""
+        playlist = self.snapshot.playlists.get(playlist_id)
+        return self._summary(playlist) if playlist is not None else None
+
+    def get_playlist_summaries(self):
+        return [self._summary(playlist) for playlist in self.snapshot.playlists.values()]
+
+    def search_songs(self, query, playlist_id=None, offset=0, limit=50):
+        """
+        Ranked search over the whole library, or one playlist if
+        `playlist_id` is given. Returns (songs in the window, total matches).
+        """
+        if not self._search_ready:
+            with self._lock:
+                self._index_titles()
+        restrict = set(self._loaded_snapshot(playlist_id).song_ids) if playlist_id else None
+        keys, total = self.search_index.search(query, offset, limit, restrict)
+        songs = [self.get_song(key) for key in keys]
+        return [song for song in songs if song is not None], total
+
+    def has_playlist(self, playlist_id):
+        return playlist_id in self.snapshot.playlists
+
+    def get_library_version(self):
+        """Changes whenever any playlist does; for caching whole-library responses."""
+        return self.snapshot.seq
+
+    def get_playlist_version(self, playlist_id):
+        """Changes whenever the playlist's metadata or songs do; None if it doesn't exist."""
+        playlist = self.snapshot.playlists.get(playlist_id)
+        return playlist.version if playlist is not None else None
+
+    def get_playlist_ids(self):
+        return list(self.snapshot.playlists)
+
+    def get_playlist(self, playlist_id):
+        """Returns a playlist with its songs materialized, or None."""
+        if playlist_id not in self.snapshot.playlists:
+            return None
+        playlist = self._loaded_snapshot(playlist_id)
+        return dict(playlist.meta, songs=list(playlist.songs))
 
     def get_all_playlists(self):
-        return self.playlists
-    
+        """Returns every playlist with its songs materialized; loads all bodies."""
+        playlists = {}
+        for playlist_id in self.get_playlist_ids():
+            playlist = self._loaded_snapshot(playlist_id)
+            if playlist.id is not None:  # Deleted meanwhile
+                playlists[playlist_id] = dict(playlist.meta, songs=list(playlist.songs))
+        return playlists
+
     def get_playlist_by_url(self, source_url):
         """
         Returns the playlist ID if a playlist with the given source URL exists, otherwise returns None.
         """
-        for playlist_id, playlist_data in self.playlists.items():
-            if playlist_data.get("source_url") == source_url:
-                return playlist_id
-        return None
-        
+        with self._lock:
+            return next(iter(self._url_index.get(source_url, ())), None)
+
+    def get_playlist_by_name(self, name):
+        """Returns the ID of the first playlist with the given name, or None."""
+        with self._lock:
+            return next(iter(self._name_index.get(name, ())), None)
+
+    def get_playlists_with_song(self, video_id):
+        """Returns the IDs of all playlists containing the given video ID."""
+        return self.index.holders(video_id)
+
+    def find_similar_playlist(self, song_ids, threshold=0.8):
+        """
+        Returns the ID of the playlist whose songs overlap most with
+        `song_ids`, if overlap / max(len(a), len(b)) reaches `threshold`.
+        Only playlists sharing at least one video are looked at.
+        """
+        new_ids = {video_id for video_id in song_ids if video_id}
+        if not new_ids:
+            return None
+        overlaps = Counter()
+        for holders in self.index.holders_many(new_ids).values():
+            overlaps.update(holders)
+
+        best_id, best_similarity = None, 0.0
+        for playlist_id, overlap in overlaps.items():
+            if overlap < threshold * len(new_ids):
+                continue  # Cannot reach the threshold whatever the playlist size
+            similarity = overlap / max(len(new_ids), self._distinct_songs(playlist_id))
+            if similarity >= threshold and similarity > best_similarity:
+                best_id, best_similarity = playlist_id, similarity
+        return best_id
+
+    def _distinct_songs(self, playlist_id):
+        with self._lock:
+            counts = self._song_ids.get(playlist_id)
+            if counts is not None:
+                return len(counts)
+        return len(self.index.playlist_songs(playlist_id))
+
     def get_playlist_url(self, playlist_id):
-        return self.playlists.get(playlist_id, {}).get('source_url', None)
-    
-    def update_playlist_if_changed(self, playlist_id, new_songs):
-        """Update the playlist only if there are new or changed songs."""
-        if playlist_id not in self.playlists:
-            return False
-
-        existing_ids = {s["id"] for s in self.playlists[playlist_id]["songs"]}
-        new_ids = {s["id"] for s in new_songs}
-
-        if existing_ids == new_ids:
-            return False  # No changes
-
-        # Update playlist with fresh songs
-        self.playlists[playlist_id]["songs"] = new_songs
-        self.save_playlists()
-        return True
-    
+        return self._meta_of(playlist_id).meta.get('source_url', None)
+
     def diff_playlist(self, playlist_id, new_songs):
         """Return lists of added and removed songs by ID."""
-        existing = {s['id'] for s in self.playlists.get(playlist_id, {}).get('songs', [])}
+        existing = set(self._loaded_snapshot(playlist_id).song_ids)
         incoming = {s['id'] for s in new_songs}
 
         added_ids = incoming - existing
         removed_ids = existing - incoming
 
         return added_ids, removed_ids
-    
+
     def song_exists(self, playlist_id, song_id):
         """Check if a song with the given ID already exists in a specific playlist."""
-        if playlist_id in self.playlists:
-            for song in self.playlists[playlist_id].get("songs", []):
-                if song.get("id") == song_id:
-                    return True
-        return False
+        self._loaded_snapshot(playlist_id)
+        with self._lock:
+            return song_id in self._song_ids.get(playlist_id, ())
 
     def ensure_default_playlist(self):
         """
         Ensure that a default 'My Songs' playlist exists.
         If not, create it and return its ID.
         """
-        # Look for an existing 'My Songs' playlist
-        for playlist_id, playlist in self.playlists.items():
-            if playlist.get("name") == "My Songs":
+        with self._create_lock:
+            # Look for an existing 'My Songs' playlist
+            playlist_id = self.get_playlist_by_name("My Songs")
+            if playlist_id:
                 return playlist_id
 
-        # If not found, create a new one
-        new_id = str(len(self.playlists) + 1)  # or use uuid if you prefer unique IDs
-        self.playlists[new_id] = {
-            "name": "My Songs",
-            "songs": [],
-            "source_url": None,
-            "thumbnail": None
-        }
-        self.save_playlists()
-        return new_id
+            # If not found, create a new one
+            new_id = str(len(self.snapshot.playlists) + 1)  # or use uuid if you prefer unique IDs
+            self._commit({
+                "op": "create_playlist",
+                "id": new_id,
+                "playlist": {
+                    "name": "My Songs",
+                    "song_ids": [],
+                    "source_url": None,
+                    "thumbnail": None
+                }
+            })
+            return new_id
@@ -0,0 +1,174 @@
+import heapq
+import itertools
+import threading
+import time
+from performance_logger import perf_logger
+
+PRIORITY_NEXT = 0        # The song that plays next
+PRIORITY_QUEUE = 1       # The rest of the play queue
+PRIORITY_BACKGROUND = 2  # Opportunistic warming (e.g. a whole playlist)
+
+
+class _Job:
+    __slots__ = ("video_id", "priority", "seq", "group", "force", "enqueued_at")
+
+    def __init__(self, video_id, priority, seq, group, force):
+        self.video_id = video_id
+        self.priority = priority
+        self.seq = seq
+        self.group = group
+        self.force = force
+        self.enqueued_at = time.time()
+
+
+class PreloadScheduler:
+    """
+    One long-lived worker that resolves stream URLs in priority order.
+    Requests for a video already queued are merged (keeping the higher
+    priority), jobs can be cancelled per group when the playlist or queue
+    changes, and extractions are spaced out to at most `rate` per second.
+    """
+
+    def __init__(self, resolve_fn, is_cached_fn, rate=2.0):
+        self.resolve_fn = resolve_fn  # resolve_fn(video_id, force) -> truthy on success
+        self.is_cached_fn = is_cached_fn
+        self.rate = rate
+        self._heap = []  # (priority, seq, video_id); stale entries are skipped on pop
+        self._jobs = {}  # video_id -> current _Job
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self._last_run = 0.0
+        self._batch = {"started": None, "video_ids": [], "success": 0}
+        self.metrics = {
+            "scheduled": 0,
+            "deduplicated": 0,
+            "cancelled": 0,
+            "skipped_cached": 0,
+            "completed": 0,
+            "failed": 0,
+            "last_lag": 0.0,
+            "max_lag": 0.0
+        }
+
+    def schedule(self, video_ids, priority=PRIORITY_QUEUE, group=None, force=False):
+        """Queue video IDs for preloading; `force` re-resolves even cached URLs."""
+        with self._cond:
+            for video_id in video_ids:
+                if not video_id:
+                    continue
+                job_priority, job_force, job_group = priority, force, group
+                job = self._jobs.get(video_id)
+                if job:
+                    self.metrics["deduplicated"] += 1
+                    if priority >= job.priority and (job.force or not force):
+                        continue
+                    # Upgrade the queued job instead of adding a second one
+                    job_priority = min(priority, job.priority)
+                    job_force = force or job.force
+                    job_group = group or job.group
+                job = _Job(video_id, job_priority, next(self._seq), job_group, job_force)
+                self._jobs[video_id] = job
+                heapq.heappush(self._heap, (job.priority, job.seq, video_id))
+                self.metrics["scheduled"] += 1
+            self._cond.notify()
+        self._start()
+
+    def cancel_group(self, group):
+        """Drop queued jobs of a group (e.g. the previous playlist's songs)."""
+        with self._cond:
+            stale = [vid for vid, job in self._jobs.items() if job.group == group]
+            for video_id in stale:
+                del self._jobs[video_id]
+            self.metrics["cancelled"] += len(stale)
+        return len(stale)
+
+    def _start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def _next_job(self):
+        """Block until a live job is available; returns None when stopped."""
+        with self._cond:
+            while True:
+                if self._stopped:
+                    return None
+                while self._heap:
+                    _, seq, video_id = heapq.heappop(self._heap)
+                    job = self._jobs.get(video_id)
+                    if job and job.seq == seq:
+                        del self._jobs[video_id]
+                        return job
+                self._finish_batch()
+                self._cond.wait()
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+
+            lag = time.time() - job.enqueued_at
+            self.metrics["last_lag"] = lag
+            self.metrics["max_lag"] = max(self.metrics["max_lag"], lag)
+
+            if not job.force and self.is_cached_fn(job.video_id):
+                self.metrics["skipped_cached"] += 1
+                continue
+
+            # Rate limit actual extractions
+            if self.rate > 0:
+                wait = self._last_run + 1.0 / self.rate - time.time()
+                if wait > 0:
+                    time.sleep(wait)
+            self._last_run = time.time()
+
+            if self._batch["started"] is None:
+                self._batch["started"] = self._last_run
+            self._batch["video_ids"].append(job.video_id)
+            try:
+                if self.resolve_fn(job.video_id, job.force):
+                    self.metrics["completed"] += 1
+                    self._batch["success"] += 1
+                else:
+                    self.metrics["failed"] += 1
+            except Exception as e:
+                self.metrics["failed"] += 1
+                print(f"Error preloading {job.video_id}: {e}")
+
+    def _finish_batch(self):
+        """Log the work done since the queue was last empty."""
+        batch = self._batch
+        if batch["started"] is None:
+            return
+        perf_logger.log_preload_operation(batch["video_ids"], time.time() - batch["started"], batch["success"])
+        self._batch = {"started": None, "video_ids": [], "success": 0}
+
+    def get_stats(self):
+        """Return queue depth, lag and job counters."""
+        now = time.time()
+        with self._cond:
+            depth = len(self._jobs)
+            by_priority = {"next": 0, "queue": 0, "background": 0}
+            names = {PRIORITY_NEXT: "next", PRIORITY_QUEUE: "queue", PRIORITY_BACKGROUND: "background"}
+            oldest = None
+            for job in self._jobs.values():
+                by_priority[names.get(job.priority, "background")] += 1
+                oldest = job.enqueued_at if oldest is None else min(oldest, job.enqueued_at)
+            stats = dict(self.metrics)
+        stats["last_lag_ms"] = round(stats.pop("last_lag") * 1000, 2)
+        stats["max_lag_ms"] = round(stats.pop("max_lag") * 1000, 2)
+        stats["queue_depth"] = depth
+        stats["queue_by_priority"] = by_priority
+        stats["oldest_wait_ms"] = round((now - oldest) * 1000, 2) if oldest else 0
+        stats["rate_per_second"] = self.rate
+        return stats
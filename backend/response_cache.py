@@ -0,0 +1,74 @@
+import gzip
+import json
+import threading
+import uuid
+from bounded_cache import BoundedCache
+
+
+class CachedResponse:
+    """A JSON body serialized once for one version of a resource; gzipped on first need."""
+
+    def __init__(self, version, body, etag):
+        self.version = version
+        self.body = body
+        self.etag = etag
+        self._gzipped = None
+        self._lock = threading.Lock()
+
+    def gzipped(self):
+        if self._gzipped is None:
+            with self._lock:
+                if self._gzipped is None:
+                    self._gzipped = gzip.compress(self.body, compresslevel=6)
+        return self._gzipped
+
+
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header names `etag`."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in tags)
+
+
+class ResponseCache:
+    """
+    Serialized JSON responses keyed by resource (e.g. one playlist's song
+    window) and tagged with the version of the data they were built from.
+    A request for a newer version rebuilds the entry, so entries are only
+    ever invalidated by the mutations that bump those versions. ETags derive
+    from the key and version alone, so a conditional request can be answered
+    before anything is built; they carry a per-process token, since versions
+    of a replaced library can repeat.
+    """
+
+    def __init__(self, max_entries=256):
+        self._entries = BoundedCache(max_entries=max_entries)
+        self._token = uuid.uuid4().hex[:8]
+        self.hits = 0
+        self.builds = 0
+        self.not_modified = 0
+
+    def etag(self, key, version):
+        return f'W/"{self._token}-{hash(key) & 0xffffffff:08x}-{version}"'
+
+    def get(self, key, version, build):
+        """Return the CachedResponse of `key` at `version`, calling `build()` for the data on a miss."""
+        entry = self._entries.get(key)
+        if entry is not None and entry.version == version:
+            self.hits += 1
+            return entry
+        body = json.dumps(build(), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        entry = CachedResponse(version, body, self.etag(key, version))
+        self._entries.set(key, entry)
+        self.builds += 1
+        return entry
+
+    def get_stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "builds": self.builds,
+            "not_modified": self.not_modified
+        }
@@ -0,0 +1,221 @@
+import bisect
+import heapq
+import re
+import threading
+
+_TOKEN_RE = re.compile(r'\w+')
+
+# Per query-token score by how the best title token matched it
+EXACT_SCORE = 3
+PREFIX_SCORE = 2
+SUBSTRING_SCORE = 1
+PRIMARY_BONUS = 1  # Match is in the cleaned title rather than artist/extra text
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall((text or "").casefold())
+
+
+def _trigrams(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+class SearchIndex:
+    """
+    Inverted index over song titles. Titles map to word tokens; a trigram
+    index over the token vocabulary answers substring queries, and a sorted
+    vocabulary answers short prefixes. Every query token must match a title
+    token (exactly, as a prefix, or as a substring); results are ranked by
+    match quality, then shorter titles first. `clean_title`, if given, marks
+    tokens of the cleaned title (e.g. `TextUtils.clean_song_title`) as
+    primary for ranking.
+
+    Scoring is done with set operations on posting lists, so queries that
+    match most of the library cost little more than selective ones.
+    """
+
+    def __init__(self, clean_title=None):
+        self.clean_title = clean_title
+        self._docs = {}       # doc_id -> (casefolded title, tokens, primary tokens)
+        self._rank_keys = {}  # doc_id -> tie-break sort key
+        self._postings = {}   # token -> set of doc_ids
+        self._primary_postings = {}  # token -> doc_ids where it is in the cleaned title
+        self._trigram_index = {}  # trigram -> set of tokens
+        self._vocabulary = []  # sorted tokens, for prefix lookups
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _primary_tokens(self, title, tokens):
+        if not self.clean_title or not title:
+            return tokens
+        if not any(c in title for c in "-(["):
+            return tokens  # clean_song_title would not change it
+        return set(tokenize(self.clean_title(title))) & tokens
+
+    def add(self, doc_id, title):
+        """Index or re-index a document; unchanged titles are skipped."""
+        folded = (title or "").casefold()
+        with self._lock:
+            existing = self._docs.get(doc_id)
+            if existing and existing[0] == folded:
+                return
+            if existing:
+                self._remove_locked(doc_id)
+            tokens = set(tokenize(folded))
+            primary = self._primary_tokens(title, tokens)
+            self._docs[doc_id] = (folded, tokens, primary)
+            self._rank_keys[doc_id] = (len(folded), folded)
+            for token in tokens:
+                docs = self._postings.get(token)
+                if docs is None:
+                    docs = self._postings[token] = set()
+                    self._add_token(token)
+                docs.add(doc_id)
+            for token in primary:
+                self._primary_postings.setdefault(token, set()).add(doc_id)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove_locked(doc_id)
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
+            self._rank_keys.clear()
+            self._postings.clear()
+            self._primary_postings.clear()
+            self._trigram_index.clear()
+            self._vocabulary.clear()
+
+    def _remove_locked(self, doc_id):
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        del self._rank_keys[doc_id]
+        for token in doc[2]:
+            docs = self._primary_postings[token]
+            docs.discard(doc_id)
+            if not docs:
+                del self._primary_postings[token]
+        for token in doc[1]:
+            docs = self._postings[token]
+            docs.discard(doc_id)
+            if not docs:
+                del self._postings[token]
+                self._remove_token(token)
+
+    def _add_token(self, token):
+        bisect.insort(self._vocabulary, token)
+        for trigram in _trigrams(token):
+            self._trigram_index.setdefault(trigram, set()).add(token)
+
+    def _remove_token(self, token):
+        i = bisect.bisect_left(self._vocabulary, token)
+        if i < len(self._vocabulary) and self._vocabulary[i] == token:
+            del self._vocabulary[i]
+        for trigram in _trigrams(token):
+            tokens = self._trigram_index.get(trigram)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._trigram_index[trigram]
+
+    def _matching_tokens(self, query_token):
+        """Vocabulary tokens containing `query_token` (prefixes only if it is under 3 chars)."""
+        if len(query_token) < 3:
+            start = bisect.bisect_left(self._vocabulary, query_token)
+            matches = []
+            for token in self._vocabulary[start:]:
+                if not token.startswith(query_token):
+                    break
+                matches.append(token)
+            return matches
+        candidates = None
+        for trigram in sorted(_trigrams(query_token), key=lambda t: len(self._trigram_index.get(t, ()))):
+            tokens = self._trigram_index.get(trigram)
+            if not tokens:
+                return []
+            candidates = set(tokens) if candidates is None else candidates & tokens
+        return [token for token in candidates if query_token in token]
+
+    def _token_levels(self, query_token, restrict):
+        """Return {score: doc_ids} for one query token, each doc at its best score."""
+        groups = {EXACT_SCORE: [], PREFIX_SCORE: [], SUBSTRING_SCORE: []}
+        for token in self._matching_tokens(query_token):
+            if token == query_token:
+                groups[EXACT_SCORE].append(token)
+            elif token.startswith(query_token):
+                groups[PREFIX_SCORE].append(token)
+            else:
+                groups[SUBSTRING_SCORE].append(token)
+
+        tiers = []
+        for base, tokens in groups.items():
+            if tokens:
+                primary = set().union(*(self._primary_postings.get(t, ()) for t in tokens))
+                tiers.append((base + PRIMARY_BONUS, primary))
+                tiers.append((base, set().union(*(self._postings[t] for t in tokens))))
+
+        levels = {}
+        assigned = set()
+        for score, docs in sorted(tiers, key=lambda tier: -tier[0]):
+            if restrict is not None:
+                docs = docs & restrict
+            docs = docs - assigned
+            if docs:
+                levels.setdefault(score, set()).update(docs)
+                assigned |= docs
+        return levels
+
+    def search(self, query, offset=0, limit=50, restrict=None):
+        """
+        Return (ranked doc_ids in the requested window, total matches).
+        `restrict`, if given, is a collection of doc_ids to search within.
+        """
+        query_tokens = list(dict.fromkeys(tokenize(query)))
+        if not query_tokens:
+            return [], 0
+        if restrict is not None and not isinstance(restrict, (set, frozenset)):
+            restrict = set(restrict)
+
+        with self._lock:
+            # Combine per-token levels: a doc's score is the sum over query tokens
+            combined = None
+            for query_token in query_tokens:
+                levels = self._token_levels(query_token, restrict)
+                if combined is None:
+                    combined = levels
+                else:
+                    merged = {}
+                    for score_a, docs_a in combined.items():
+                        for score_b, docs_b in levels.items():
+                            docs = docs_a & docs_b
+                            if docs:
+                                merged.setdefault(score_a + score_b, set()).update(docs)
+                    combined = merged
+                if not combined:
+                    return [], 0
+
+            total = sum(len(docs) for docs in combined.values())
+            wanted = total if limit is None else offset + limit
+            ranked = []
+            for score in sorted(combined, reverse=True):
+                docs = combined[score]
+                if len(ranked) + len(docs) <= offset:
+                    ranked.extend([None] * len(docs))  # Whole level is before the window
+                    continue
+                need = wanted - len(ranked)
+                ranked.extend(heapq.nsmallest(need, docs, key=self._rank_keys.__getitem__))
+                if len(ranked) >= wanted:
+                    break
+        return ranked[offset:wanted], total
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "documents": len(self._docs),
+                "tokens": len(self._postings),
+                "trigrams": len(self._trigram_index)
+            }
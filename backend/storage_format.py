@@ -0,0 +1,123 @@
+import json
+import os
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class StorageFormat:
+    """
+    Encoding of a whole document (e.g. the playlist snapshot) to bytes.
+    Files of a format are recognised by `suffix`.
+    """
+
+    name = None
+    suffix = None
+
+    def dumps(self, obj):
+        raise NotImplementedError
+
+    def loads(self, data):
+        raise NotImplementedError
+
+
+class JSONFormat(StorageFormat):
+    """Compact UTF-8 JSON; always available and readable by hand."""
+
+    name = "json"
+    suffix = ".json"
+
+    def dumps(self, obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class MsgpackFormat(StorageFormat):
+    """MessagePack; several times faster to parse than JSON for large documents."""
+
+    name = "msgpack"
+    suffix = ".msgpack"
+
+    def dumps(self, obj):
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, data):
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+class ZstdFormat(StorageFormat):
+    """Another format wrapped in a zstd frame; decompression costs far less than the I/O it saves."""
+
+    def __init__(self, inner, level=3):
+        self.inner = inner
+        self.level = level
+        self.name = inner.name + "+zstd"
+        self.suffix = inner.suffix + ".zst"
+
+    def dumps(self, obj):
+        return zstandard.ZstdCompressor(level=self.level).compress(self.inner.dumps(obj))
+
+    def loads(self, data):
+        return self.inner.loads(zstandard.ZstdDecompressor().decompress(data))
+
+
+def available_formats():
+    """Formats usable with the installed packages, most preferred first."""
+    formats = []
+    if msgpack is not None:
+        if zstandard is not None:
+            formats.append(ZstdFormat(MsgpackFormat()))
+        formats.append(MsgpackFormat())
+    if zstandard is not None:
+        formats.append(ZstdFormat(JSONFormat()))
+    formats.append(JSONFormat())
+    return formats
+
+
+def get_format(name=None):
+    """Return the format called `name`, or the best available one if None."""
+    formats = available_formats()
+    if name is None:
+        return formats[0]
+    for fmt in formats:
+        if fmt.name == name:
+            return fmt
+    raise ValueError(f"Storage format '{name}' is unknown or its package is not installed")
+
+
+def format_for_path(path):
+    """Return the available format whose suffix `path` ends with, or None."""
+    matches = [fmt for fmt in available_formats() if path.endswith(fmt.suffix)]
+    return max(matches, key=lambda fmt: len(fmt.suffix)) if matches else None
+
+
+def read_file(path, fmt=None):
+    fmt = fmt or format_for_path(path)
+    if fmt is None:
+        raise ValueError(f"No installed storage format can read {path}")
+    with open(path, 'rb') as f:
+        return fmt.loads(f.read())
+
+
+def write_file(path, obj, fmt=None):
+    """Atomically replace `path` with `obj` encoded in `fmt`."""
+    fmt = fmt or format_for_path(path)
+    if fmt is None:
+        raise ValueError(f"No installed storage format can write {path}")
+    data = fmt.dumps(obj)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(data)
@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+from preload_scheduler import PRIORITY_QUEUE
+
+
+class StreamUrlRefresher:
+    """
+    Re-resolves stream URLs for queued and recently played songs before
+    their embedded expiry, so playback almost always hits a valid cache entry.
+    A song still due after a refresh (e.g. a removed video) is retried with
+    exponential backoff and dropped after `max_attempts`.
+    """
+
+    def __init__(self, streamer, refresh_window=900, check_interval=60, max_tracked=50, hot_duration=7200,
+                 max_attempts=5):
+        self.streamer = streamer
+        self.refresh_window = refresh_window  # Refresh URLs expiring within 15 minutes
+        self.check_interval = check_interval
+        self.max_tracked = max_tracked
+        self.hot_duration = hot_duration  # Stop refreshing songs untouched for 2 hours
+        self.max_attempts = max_attempts
+        self.hot_ids = OrderedDict()  # video_id -> last time it was queued or played
+        self._attempts = {}  # video_id -> (refreshes that left it due, time of the next allowed one)
+        self.refresh_count = 0
+        self.gave_up_count = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def track(self, video_ids):
+        """Mark songs as hot; starts the refresher thread on first use."""
+        now = time.time()
+        with self._lock:
+            for video_id in video_ids:
+                if not video_id:
+                    continue
+                self.hot_ids.pop(video_id, None)
+                self.hot_ids[video_id] = now
+            while len(self.hot_ids) > self.max_tracked:
+                video_id, _ = self.hot_ids.popitem(last=False)
+                self._attempts.pop(video_id, None)
+        self.start()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _due_ids(self):
+        """Return hot IDs whose cached URL is missing or about to expire and not backing off."""
+        now = time.time()
+        due = []
+        with self._lock:
+            for video_id, touched in list(self.hot_ids.items()):
+                if now - touched > self.hot_duration:
+                    del self.hot_ids[video_id]
+                    self._attempts.pop(video_id, None)
+                    continue
+                expires_at = self.streamer.get_url_expiry(video_id)
+                if expires_at is not None and expires_at - now >= self.refresh_window:
+                    self._attempts.pop(video_id, None)  # The last refresh worked
+                    continue
+                attempts, retry_at = self._attempts.get(video_id, (0, 0))
+                if now < retry_at:
+                    continue
+                if attempts >= self.max_attempts:
+                    # Keeps failing to resolve; stop spending extractor slots on it
+                    del self.hot_ids[video_id]
+                    del self._attempts[video_id]
+                    self.gave_up_count += 1
+                    continue
+                self._attempts[video_id] = (attempts + 1, now + self.check_interval * 2 ** attempts)
+                due.append(video_id)
+        return due
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            due = self._due_ids()
+            if due:
+                # Refreshes share the preload worker, its dedupe and its rate limit
+                self.streamer.preload_scheduler.schedule(due, PRIORITY_QUEUE, group="refresh", force=True)
+                self.refresh_count += len(due)
+
+    def get_stats(self):
+        with self._lock:
+            tracked = len(self.hot_ids)
+            backing_off = sum(1 for attempts, _ in self._attempts.values() if attempts > 1)
+        return {
+            "tracked": tracked,
+            "refreshes_scheduled": self.refresh_count,
+            "backing_off": backing_off,
+            "gave_up": self.gave_up_count
+        }
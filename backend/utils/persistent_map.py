@@ -0,0 +1,141 @@
+from collections.abc import Mapping
+
+_BITS = 5
+_WIDTH = 1 << _BITS
+_MASK = _WIDTH - 1
+_DEPTH = 3  # 32768 leaves; a leaf holds ~30 keys at a million entries
+
+
+class PersistentMap(Mapping):
+    """
+    Immutable mapping whose `set`/`delete` return a new map in O(log n):
+    only the path from the root to the changed key's leaf is copied, every
+    other branch is shared with the original. Iteration follows insertion
+    order (an updated key keeps its place), like a dict.
+
+    Internally a fixed-depth hash trie: nodes are 32-slot tuples, leaves
+    small dicts of key -> (order, value).
+    """
+
+    __slots__ = ("_root", "_len", "_next")
+
+    def __init__(self, items=None):
+        self._root = None
+        self._len = 0
+        self._next = 0
+        if items:
+            pairs = items.items() if isinstance(items, Mapping) else items
+            root = [None] * _WIDTH
+            for key, value in pairs:
+                node = root
+                h = hash(key)
+                for level in range(_DEPTH - 1):
+                    i = (h >> (level * _BITS)) & _MASK
+                    if node[i] is None:
+                        node[i] = [None] * _WIDTH
+                    node = node[i]
+                leaf = node[(h >> ((_DEPTH - 1) * _BITS)) & _MASK]
+                if leaf is None:
+                    leaf = node[(h >> ((_DEPTH - 1) * _BITS)) & _MASK] = {}
+                if key in leaf:
+                    leaf[key] = (leaf[key][0], value)
+                else:
+                    leaf[key] = (self._next, value)
+                    self._next += 1
+                    self._len += 1
+            self._root = _freeze(root, 0)
+
+    @classmethod
+    def _make(cls, root, length, next_order):
+        new = cls.__new__(cls)
+        new._root = root
+        new._len = length
+        new._next = next_order
+        return new
+
+    def _leaf(self, key):
+        node = self._root
+        h = hash(key)
+        for level in range(_DEPTH):
+            if node is None:
+                return None
+            node = node[(h >> (level * _BITS)) & _MASK]
+        return node
+
+    def __getitem__(self, key):
+        leaf = self._leaf(key)
+        if leaf is None or key not in leaf:
+            raise KeyError(key)
+        return leaf[key][1]
+
+    def __contains__(self, key):
+        leaf = self._leaf(key)
+        return leaf is not None and key in leaf
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return (key for _, key, _ in self._ordered())
+
+    def items(self):
+        return [(key, value) for _, key, value in self._ordered()]
+
+    def values(self):
+        return [value for _, _, value in self._ordered()]
+
+    def _ordered(self):
+        entries = []
+        stack = [(self._root, 0)] if self._root is not None else []
+        while stack:
+            node, level = stack.pop()
+            if level == _DEPTH:
+                entries.extend((order, key, value) for key, (order, value) in node.items())
+            else:
+                stack.extend((child, level + 1) for child in node if child is not None)
+        entries.sort(key=lambda entry: entry[0])
+        return entries
+
+    def set(self, key, value):
+        """Return a new map with `key` set to `value`."""
+        root, added = _set(self._root, hash(key), 0, key, value, self._next)
+        return self._make(root, self._len + added, self._next + added)
+
+    def delete(self, key):
+        """Return a new map without `key` (this map if it is absent)."""
+        if key not in self:
+            return self
+        return self._make(_delete(self._root, hash(key), 0, key), self._len - 1, self._next)
+
+
+def _freeze(node, level):
+    if node is None or level == _DEPTH:
+        return node
+    return tuple(_freeze(child, level + 1) for child in node)
+
+
+def _set(node, h, level, key, value, order):
+    """Path-copying insert; returns (new node, 1 if the key was added else 0)."""
+    if level == _DEPTH:
+        leaf = dict(node) if node else {}
+        if key in leaf:
+            leaf[key] = (leaf[key][0], value)
+            return leaf, 0
+        leaf[key] = (order, value)
+        return leaf, 1
+    slots = list(node) if node is not None else [None] * _WIDTH
+    i = (h >> (level * _BITS)) & _MASK
+    slots[i], added = _set(slots[i], h, level + 1, key, value, order)
+    return tuple(slots), added
+
+
+def _delete(node, h, level, key):
+    """Path-copying delete of a present key; empty branches collapse to None."""
+    if level == _DEPTH:
+        leaf = dict(node)
+        del leaf[key]
+        return leaf or None
+    slots = list(node)
+    i = (h >> (level * _BITS)) & _MASK
+    slots[i] = _delete(slots[i], h, level + 1, key)
+    return tuple(slots) if any(slot is not None for slot in slots) else None
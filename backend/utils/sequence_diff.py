@@ -0,0 +1,38 @@
+from difflib import SequenceMatcher
+
+
+def diff_sequences(old, new):
+    """
+    Return a splice edit script turning `old` into `new`: a list of
+    [start, end, replacement] meaning old[start:end] = replacement, in
+    descending order of `start` so each can be applied in turn without
+    shifting the indices of the others. An empty list means no change.
+    """
+    if len(old) == len(new) and all(a == b for a, b in zip(old, new)):
+        return []
+    matcher = SequenceMatcher(None, old, new, autojunk=False)
+    edits = [
+        [i1, i2, list(new[j1:j2])]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != 'equal'
+    ]
+    edits.reverse()
+    return edits
+
+
+def apply_edits(sequence, edits):
+    """Apply a script from diff_sequences to a list in place."""
+    for start, end, replacement in edits:
+        sequence[start:end] = replacement
+    return sequence
+
+
+def summarize_edits(old, edits):
+    """Return (inserted, deleted, moved) item sets of an edit script over `old`."""
+    removed = set()
+    added = set()
+    for start, end, replacement in edits:
+        removed.update(old[start:end])
+        added.update(replacement)
+    moved = removed & added
+    return added - moved, removed - moved, moved
@@ -1,24 +1,53 @@
+import asyncio
 import threading
 import yt_dlp as yt
 import re
 import time
-import json
-import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlparse, parse_qs
 from performance_logger import perf_logger
+from cache_store import SQLiteCacheStore, migrate_json_file
+from bounded_cache import BoundedCache
+from audio_cache import AudioCache
+from url_refresher import StreamUrlRefresher
+from preload_scheduler import PreloadScheduler, PRIORITY_QUEUE
+from extractor_pool import YoutubeDLPool
+from format_selector import FormatSelector
+from utils.single_flight import SingleFlight
 
 class YouTubeStreamer:
     """
     Handles fetching data from YouTube using yt-dlp.
     """
 
-    def __init__(self, on_playlist_info_fetched, on_single_song_info_fetched):
+    URL_NAMESPACE = "urls"
+    METADATA_NAMESPACE = "metadata"
+
+    def __init__(self, on_playlist_info_fetched, on_single_song_info_fetched, cache_store=None):
         self.on_playlist_info_fetched = on_playlist_info_fetched
         self.on_single_song_info_fetched = on_single_song_info_fetched
-        self.url_cache_file = "song_url_cache.json"
+        self.cache_store = cache_store or SQLiteCacheStore()
+        self.cache_duration = 21600  # 6 hours, for URLs without an embedded expiry
+        self.url_expiry_margin = 300  # Treat URLs as stale 5 minutes before they expire
+        self.url_cache_file = "song_url_cache.json"  # Legacy JSON cache, migrated on first run
         self.url_cache = self._load_url_cache()
-        self.cache_duration = 21600  # 6 hours cache
-        self.metadata_cache_file = "song_metadata_cache.json"
+        self.metadata_cache_file = "song_metadata_cache.json"  # Legacy JSON cache, migrated on first run
         self.metadata_cache = self._load_metadata_cache()
+        self.url_refresher = StreamUrlRefresher(self)
+        self.audio_cache = AudioCache(self.cache_store)
+        self.preload_scheduler = PreloadScheduler(self._preload_resolve, self.has_valid_url)
+        self._resolve_flight = SingleFlight()
+        # Bounded pool for song resolves requested from async handlers
+        self.max_concurrent_resolves = 4
+        self._resolve_executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrent_resolves, thread_name_prefix="song-resolve"
+        )
+        self._resolve_waiting = 0
+        # Metadata store writes held back by batched_metadata_writes()
+        self._metadata_batch_lock = threading.Lock()
+        self._metadata_batches = 0
+        self._pending_metadata = {}
         self.ydl_opts = {
             'quiet': True,
             'no_warnings': True,
@@ -26,6 +55,21 @@ class YouTubeStreamer:
             'nocheckcertificate': True,
             'ignoreerrors': True
         }
+        self.format_selector = FormatSelector()
+        self.extractor_pool = YoutubeDLPool(self._extractor_profiles(), max_per_profile=8)
+
+    def _extractor_profiles(self):
+        """yt-dlp option profiles served by the extractor pool."""
+        stream_opts = self.ydl_opts.copy()
+        stream_opts.pop('extract_flat', None)
+        return {
+            "playlist": {
+                "quiet": True,
+                "extract_flat": True,  # ✅ Only basic info (no full download of all songs)
+                "skip_download": True
+            },
+            "stream": stream_opts
+        }
 
     def get_playlist_info(self, url, existing_ids=None):
         threading.Thread(target=self._fetch_playlist_data, args=(url, existing_ids), daemon=True).start()
@@ -49,37 +93,34 @@ class YouTubeStreamer:
 
     def _fetch_playlist_data(self, url, existing_ids=None):
         """Fetches playlist data asynchronously."""
-        ydl_opts = {
-            "quiet": True,
-            "extract_flat": True,  # ✅ Only basic info (no full download of all songs)
-            "skip_download": True
-        }
-
-        with yt.YoutubeDL(ydl_opts) as ydl:
-            try:
-                info = ydl.extract_info(url, download=False)
-
-                playlist_info = {
-                    "title": info.get("title", "Unknown Playlist"),
-                    "original_url": url,
-                    "thumbnail_url": info.get("thumbnails", [{}])[-1].get("url") if info.get("thumbnails") else None,
-                    "entries": []
-                }
+        try:
+            playlist_info = self.fetch_playlist_info(url)
+        except Exception as e:
+            print(f"Error fetching playlist info: {e}")
+            playlist_info = None
+        self.on_playlist_info_fetched(playlist_info)
 
-                for entry in info.get("entries", []):
-                    if entry and "id" in entry:
-                        playlist_info["entries"].append({
-                            "id": entry.get("id"),
-                            "title": entry.get("title"),
-                            "url": f"https://www.youtube.com/watch?v={entry['id']}",
-                            "thumbnail_url": entry.get("thumbnails", [{}])[-1].get("url") if entry.get("thumbnails") else None,
-                        })
+    def fetch_playlist_info(self, url):
+        """Fetch a playlist's title, thumbnail and flat entries; raises on extraction errors."""
+        with self.extractor_pool.extractor('playlist') as ydl:
+            info = ydl.extract_info(url, download=False)
 
-                self.on_playlist_info_fetched(playlist_info)
+        playlist_info = {
+            "title": info.get("title", "Unknown Playlist"),
+            "original_url": url,
+            "thumbnail_url": info.get("thumbnails", [{}])[-1].get("url") if info.get("thumbnails") else None,
+            "entries": []
+        }
 
-            except Exception as e:
-                print(f"Error fetching playlist info: {e}")
-                self.on_playlist_info_fetched(None)
+        for entry in info.get("entries", []):
+            if entry and "id" in entry:
+                playlist_info["entries"].append({
+                    "id": entry.get("id"),
+                    "title": entry.get("title"),
+                    "url": f"https://www.youtube.com/watch?v={entry['id']}",
+                    "thumbnail_url": entry.get("thumbnails", [{}])[-1].get("url") if entry.get("thumbnails") else None,
+                })
+        return playlist_info
 
     def _fetch_single_song_data(self, url):
         """Fetch info async for adding single songs."""
@@ -87,9 +128,10 @@ class YouTubeStreamer:
         if full_song_info:
             self.on_single_song_info_fetched(full_song_info)
 
-    def _fetch_single_song_data_sync(self, url):
+    def _fetch_single_song_data_sync(self, url, fallback=True):
         """
-        Fetches song metadata with caching.
+        Fetches song metadata with caching. If extraction fails, returns
+        placeholder info built from the video ID when `fallback`, else {}.
         """
         print(f"[YouTubeStreamer] Starting sync fetch for: {url}")
         
@@ -107,182 +149,306 @@ class YouTubeStreamer:
         print(f"[YouTubeStreamer] No cache found, fetching from YouTube...")
         full_song_info = {}
         try:
-            # Try metadata-only extraction first
-            opts = {
-                'quiet': True,
-                'no_warnings': True,
-                'skip_download': True,
-                'extract_flat': False
-            }
-
-            with yt.YoutubeDL(opts) as ydl:
-                print(f"[YouTubeStreamer] Calling yt-dlp extract_info...")
-                info_dict = ydl.extract_info(url, download=False)
-                print(f"[YouTubeStreamer] yt-dlp returned: {bool(info_dict)}")
-
-                if info_dict:
-                    full_song_info = {
-                        "title": info_dict.get('title', 'Unknown Title'),
-                        "id": info_dict.get('id', video_id),
-                        "duration": info_dict.get('duration', 0),
-                        "thumbnail_url": info_dict.get('thumbnail')
-                    }
-                    print(f"[YouTubeStreamer] Extracted song info: {full_song_info}")
-                    
-                    # Cache the metadata
-                    if video_id:
-                        self._cache_metadata(video_id, full_song_info)
-                        print(f"[YouTubeStreamer] Cached metadata for {video_id}")
-
+            # One extraction caches both the metadata and the stream URL
+            resolved = self.resolve(video_id, url)
+            if resolved:
+                full_song_info = resolved["metadata"]
+                print(f"[YouTubeStreamer] Extracted song info: {full_song_info}")
         except yt.DownloadError as e:
             print(f"[YouTubeStreamer] yt-dlp DownloadError: {e}")
-            # Fallback: create basic info from URL
-            if video_id:
-                full_song_info = {
-                    "title": f"Video {video_id}",
-                    "id": video_id,
-                    "duration": 0,
-                    "thumbnail_url": f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg"
-                }
         except Exception as e:
             print(f"[YouTubeStreamer] Unexpected error: {e}")
+
+        if not full_song_info and video_id and fallback:
             # Fallback: create basic info from URL
-            if video_id:
-                full_song_info = {
-                    "title": f"Video {video_id}",
-                    "id": video_id,
-                    "duration": 0,
-                    "thumbnail_url": f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg"
-                }
+            full_song_info = {
+                "title": f"Video {video_id}",
+                "id": video_id,
+                "duration": 0,
+                "thumbnail_url": f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg"
+            }
 
         print(f"[YouTubeStreamer] Final result: {full_song_info}")
         return full_song_info
 
-    def fetch_full_song_info(self, url: str):
+    def fetch_full_song_info(self, url: str, fallback=True):
         """
         Public wrapper to fetch a song's full metadata (sync).
         Useful for playlist syncing when added/removed songs are detected.
         """
         print(f"[YouTubeStreamer] Fetching song info for: {url}")
-        result = self._fetch_single_song_data_sync(url)
+        result = self._fetch_single_song_data_sync(url, fallback)
         print(f"[YouTubeStreamer] Song info result: {result}")
         return result
+
+    async def fetch_full_song_info_async(self, url: str, fallback=True):
+        """
+        `fetch_full_song_info` for async callers: the extraction runs on the
+        bounded resolve pool so the event loop keeps serving other requests.
+        """
+        return await self._run_resolve(self.fetch_full_song_info, url, fallback)
+
+    async def fetch_playlist_info_async(self, url: str):
+        """`fetch_playlist_info` on the bounded resolve pool; raises on extraction errors."""
+        return await self._run_resolve(self.fetch_playlist_info, url)
+
+    async def _run_resolve(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        self._resolve_waiting += 1
+        try:
+            return await loop.run_in_executor(self._resolve_executor, fn, *args)
+        finally:
+            self._resolve_waiting -= 1
     
-    def get_fresh_stream_url(self, video_id, silent=False):
+    def get_fresh_stream_url(self, video_id, silent=False, force_refresh=False):
         """
         Get a stream URL for a video ID with caching.
+        Cached URLs are used until shortly before the expiry embedded in them;
+        `force_refresh` skips the cache (used by the background refresher).
         """
         start_time = time.time()
-        current_time = time.time()
-        from_cache = False
         
         # Check cache first
-        if video_id in self.url_cache:
-            cached_data = self.url_cache[video_id]
-            if isinstance(cached_data, (list, tuple)) and len(cached_data) >= 2:
-                cached_url, timestamp = cached_data[0], cached_data[1]
-                if current_time - timestamp < self.cache_duration:
-                    if not silent:
-                        print(f"Using cached URL for {video_id}")
-                    from_cache = True
-                    load_time = time.time() - start_time
-                    perf_logger.log_song_load(video_id, "Cached Song", load_time, from_cache)
-                    return cached_url
+        cached_url = None if force_refresh else self._get_cached_url(video_id)
+        if cached_url:
+            if not silent:
+                print(f"Using cached URL for {video_id}")
+            load_time = time.time() - start_time
+            perf_logger.log_song_load(video_id, "Cached Song", load_time, from_cache=True)
+            return cached_url
         
         # Fetch fresh URL
         if not silent:
             print(f"Fetching fresh URL for {video_id}")
-        url = f"https://www.youtube.com/watch?v={video_id}"
         try:
-            opts = self.ydl_opts.copy()
-            opts.pop('extract_flat', None)
-
-            with yt.YoutubeDL(opts) as ydl:
-                info_dict = ydl.extract_info(url, download=False)
-
-                if info_dict:
-                    best_audio = next(
-                        (f for f in info_dict.get('formats', [])
-                         if f.get('acodec') != 'none' and f.get('vcodec') == 'none'),
-                        None
-                    )
-                    
-                    if best_audio:
-                        stream_url = best_audio.get('url')
-                        # Cache the URL
-                        self.url_cache[video_id] = (stream_url, current_time)
-                        self._save_url_cache()
-                        
-                        load_time = time.time() - start_time
-                        title = info_dict.get('title', 'Unknown')
-                        perf_logger.log_song_load(video_id, title, load_time, from_cache)
-                        return stream_url
-                        
+            resolved = self.resolve(video_id)
+            if resolved:
+                return resolved["stream_url"]
         except Exception as e:
             if not silent:
                 print(f"Error getting stream URL: {e}")
             
         return None
+
+    def resolve(self, video_id, url=None):
+        """
+        Resolve a song's metadata and stream URL with a single yt-dlp
+        extraction, filling both the metadata and URL caches.
+        Concurrent callers for the same song share one in-flight extraction.
+        Returns {"metadata": ..., "stream_url": ...} or None.
+        """
+        if video_id:
+            url = f"https://www.youtube.com/watch?v={video_id}"
+        return self._resolve_flight.do(video_id or url, self._extract_song, video_id, url)
+
+    def _extract_song(self, video_id, url):
+        """Run one yt-dlp extraction and cache everything it returned."""
+        start_time = time.time()
+        with self.extractor_pool.extractor('stream') as ydl:
+            info_dict = ydl.extract_info(url, download=False)
+
+        if not info_dict:
+            return None
+
+        video_id = video_id or info_dict.get('id')
+        metadata = {
+            "title": info_dict.get('title', 'Unknown Title'),
+            "id": info_dict.get('id', video_id),
+            "duration": info_dict.get('duration', 0),
+            "thumbnail_url": info_dict.get('thumbnail')
+        }
+
+        audio_format = self.format_selector.select(info_dict.get('formats', []))
+        stream_url = audio_format.get('url') if audio_format else None
+        format_id = audio_format.get('format_id') if audio_format else None
+
+        if video_id:
+            self._cache_metadata(video_id, metadata)
+            if stream_url:
+                # Cache the URL until the expiry YouTube embedded in it
+                self._cache_url(video_id, stream_url, start_time, format_id)
+
+        load_time = time.time() - start_time
+        perf_logger.log_song_load(video_id, metadata["title"], load_time, from_cache=False)
+        return {"metadata": metadata, "stream_url": stream_url, "format_id": format_id}
     
     def _load_metadata_cache(self):
-        """Load metadata cache from file."""
-        if os.path.exists(self.metadata_cache_file):
-            try:
-                with open(self.metadata_cache_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
-    
-    def _save_metadata_cache(self):
-        """Save metadata cache to file."""
-        try:
-            with open(self.metadata_cache_file, 'w', encoding='utf-8') as f:
-                json.dump(self.metadata_cache, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            print(f"Error saving metadata cache: {e}")
+        """Create the in-memory metadata cache; entries are read through from the store."""
+        migrate_json_file(self.cache_store, self.METADATA_NAMESPACE, self.metadata_cache_file)
+        return BoundedCache(max_entries=10000)
     
     def _get_cached_metadata(self, video_id):
         """Get cached metadata for a video ID."""
-        return self.metadata_cache.get(video_id)
+        metadata = self.metadata_cache.get(video_id)
+        if metadata is None:
+            metadata = self._pending_metadata.get(video_id)
+        if metadata is None:
+            metadata = self.cache_store.get(self.METADATA_NAMESPACE, video_id)
+            if metadata is not None:
+                self.metadata_cache.set(video_id, metadata)
+        return metadata
     
     def _cache_metadata(self, video_id, metadata):
         """Cache metadata for a video ID."""
-        self.metadata_cache[video_id] = metadata
-        self._save_metadata_cache()
+        self.metadata_cache.set(video_id, metadata)
+        with self._metadata_batch_lock:
+            if self._metadata_batches:
+                self._pending_metadata[video_id] = metadata
+                return
+        self.cache_store.put(self.METADATA_NAMESPACE, video_id, metadata)
+
+    @contextmanager
+    def batched_metadata_writes(self):
+        """
+        Hold back metadata store writes made while the block runs (on any
+        thread) and persist them with one batched upsert when the last open
+        block ends. The in-memory cache is updated immediately.
+        """
+        with self._metadata_batch_lock:
+            self._metadata_batches += 1
+        try:
+            yield
+        finally:
+            with self._metadata_batch_lock:
+                self._metadata_batches -= 1
+                pending = {}
+                if not self._metadata_batches:
+                    pending, self._pending_metadata = self._pending_metadata, {}
+            if pending:
+                self.cache_metadata_many(pending.values())
+
+    def cache_metadata_many(self, songs):
+        """Cache metadata for several songs with one batched upsert (a single transaction)."""
+        entries = [(song['id'], song, None) for song in songs if song.get('id')]
+        for video_id, metadata, _ in entries:
+            self.metadata_cache.set(video_id, metadata)
+        self.cache_store.put_many(self.METADATA_NAMESPACE, entries)
     
     def _load_url_cache(self):
-        """Load URL cache from file."""
-        if os.path.exists(self.url_cache_file):
-            try:
-                with open(self.url_cache_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
-    
-    def _save_url_cache(self):
-        """Save URL cache to file."""
+        """Create the in-memory URL cache; entries are read through from the store."""
+        def legacy_expiry(video_id, cached_data):
+            if isinstance(cached_data, (list, tuple)) and len(cached_data) >= 2:
+                return cached_data[1] + self.cache_duration
+            return 0
+
+        migrate_json_file(self.cache_store, self.URL_NAMESPACE, self.url_cache_file, legacy_expiry)
+        return BoundedCache(max_entries=2000)
+
+    def _get_url_entry(self, video_id):
+        """Return the URL cache entry for a video ID, reading through to the store."""
+        cached_data = self.url_cache.get(video_id)
+        if cached_data is None:
+            cached_data = self.cache_store.get(self.URL_NAMESPACE, video_id)
+            if cached_data is not None:
+                self.url_cache.set(video_id, cached_data, expires_at=self._url_entry_fields(cached_data)[1])
+        return cached_data
+
+    def _parse_url_expiry(self, stream_url):
+        """Return the expiry timestamp embedded in a googlevideo URL, if any."""
+        if not stream_url:
+            return None
+        expire = parse_qs(urlparse(stream_url).query).get('expire')
+        if expire:
+            value = expire[0]
+        else:
+            # Some manifests use path parameters (/expire/<ts>/) instead
+            match = re.search(r'/expire/(\d+)', stream_url)
+            value = match.group(1) if match else None
         try:
-            with open(self.url_cache_file, 'w', encoding='utf-8') as f:
-                json.dump(self.url_cache, f, indent=2)
-        except Exception as e:
-            print(f"Error saving URL cache: {e}")
+            return float(value) if value else None
+        except ValueError:
+            return None
+
+    def _url_entry_fields(self, cached_data):
+        """Return (url, expires_at) for a URL cache entry in either format."""
+        if isinstance(cached_data, dict):
+            return cached_data.get('url'), cached_data.get('expires_at', 0)
+        if isinstance(cached_data, (list, tuple)) and len(cached_data) >= 2:
+            # Legacy (url, fetched_at) entries
+            return cached_data[0], cached_data[1] + self.cache_duration
+        return None, 0
+
+    def _cache_url(self, video_id, stream_url, fetched_at, format_id=None):
+        """Cache a stream URL with its real expiry time and chosen format (itag)."""
+        expires_at = self._parse_url_expiry(stream_url) or fetched_at + self.cache_duration
+        entry = {
+            "url": stream_url,
+            "format_id": format_id,
+            "fetched_at": fetched_at,
+            "expires_at": expires_at
+        }
+        self.url_cache.set(video_id, entry, expires_at=expires_at)
+        self.cache_store.put(self.URL_NAMESPACE, video_id, entry, expires_at=expires_at)
+
+    def _get_cached_url(self, video_id):
+        """Return the cached URL if it stays valid for at least the safety margin."""
+        cached_data = self._get_url_entry(video_id)
+        if not cached_data:
+            return None
+        cached_url, expires_at = self._url_entry_fields(cached_data)
+        if cached_url and time.time() < expires_at - self.url_expiry_margin:
+            return cached_url
+        return None
+
+    def get_url_expiry(self, video_id):
+        """Return the expiry timestamp of the cached URL, or None if not cached."""
+        cached_data = self._get_url_entry(video_id)
+        if not cached_data:
+            return None
+        return self._url_entry_fields(cached_data)[1]
+
+    def get_cached_format_id(self, video_id):
+        """Return the itag of the cached stream URL, if known."""
+        cached_data = self._get_url_entry(video_id)
+        return cached_data.get('format_id') if isinstance(cached_data, dict) else None
+
+    def has_valid_url(self, video_id):
+        """Check whether a usable stream URL is cached for a video ID."""
+        return self._get_cached_url(video_id) is not None
+
+    def mark_hot(self, video_ids):
+        """Keep URLs for queued/recently played songs fresh in the background."""
+        self.url_refresher.track(video_ids)
+
+    def get_extraction_stats(self):
+        """Return extractor pool metrics and single-flight dedupe counters."""
+        return {
+            "pool": self.extractor_pool.get_stats(),
+            "resolve_single_flight": self._resolve_flight.get_stats(),
+            "resolve_pool": {
+                "max_workers": self.max_concurrent_resolves,
+                "waiting": self._resolve_waiting
+            }
+        }
+
+    def get_cache_stats(self):
+        """Return persisted entry counts plus in-memory cache statistics."""
+        return {
+            "url_cache_count": self.cache_store.count(self.URL_NAMESPACE),
+            "metadata_cache_count": self.cache_store.count(self.METADATA_NAMESPACE),
+            "audio_cache_count": self.audio_cache.get_stats()["tracks"],
+            "memory": {
+                "url_cache": self.url_cache.get_stats(),
+                "metadata_cache": self.metadata_cache.get_stats()
+            },
+            "audio": self.audio_cache.get_stats()
+        }
+
+    def purge_expired_cache(self):
+        """Drop expired URL entries from memory and from the store."""
+        return self.url_cache.purge_expired() + self.cache_store.purge_expired()
+
+    def clear_cache(self):
+        """Clear URL, metadata and audio caches, both persisted and in memory."""
+        self.cache_store.clear(self.URL_NAMESPACE)
+        self.cache_store.clear(self.METADATA_NAMESPACE)
+        self.url_cache.clear()
+        self.metadata_cache.clear()
+        self.audio_cache.clear()
     
-    def preload_song_urls(self, video_ids):
-        """Preload URLs for multiple songs in background."""
-        def preload_worker():
-            start_time = time.time()
-            success_count = 0
-            
-            for video_id in video_ids[:5]:  # Limit to 5 songs
-                if video_id not in self.url_cache:
-                    result = self.get_fresh_stream_url(video_id, silent=True)
-                    if result:
-                        success_count += 1
-                    time.sleep(0.5)  # Small delay between requests
-            
-            preload_time = time.time() - start_time
-            perf_logger.log_preload_operation(video_ids[:5], preload_time, success_count)
-        
-        threading.Thread(target=preload_worker, daemon=True).start()
+    def preload_song_urls(self, video_ids, priority=PRIORITY_QUEUE, group=None):
+        """Queue songs for background URL preloading."""
+        self.preload_scheduler.schedule(video_ids, priority, group)
+
+    def _preload_resolve(self, video_id, force):
+        return self.get_fresh_stream_url(video_id, silent=True, force_refresh=force)
@@ -4,7 +4,7 @@ import PlaylistView from './components/PlaylistView';
 import HomeView from './components/HomeView';
 import SongsView from './components/SongsView';
 import SettingsView from './components/SettingsView';
-import { musicAPI } from './services/api';
+import { musicAPI, PlayerStateSocket } from './services/api';
 import './svara-player.css';
 
 function App() {
@@ -19,13 +19,26 @@ function App() {
   const [globalLoading, setGlobalLoading] = useState(false);
   const [globalLoadingMessage, setGlobalLoadingMessage] = useState('');
   const [progressData, setProgressData] = useState(null);
+  const [statusLive, setStatusLive] = useState(false);
 
   useEffect(() => {
     updateStatus();
-    const interval = setInterval(updateStatus, 500);
-    return () => clearInterval(interval);
+    const socket = new PlayerStateSocket((state) => {
+      setStatus(state);
+      setError(null);
+      setLoading(false);
+    }, setStatusLive);
+    socket.connect();
+    return () => socket.disconnect();
   }, []);
 
+  useEffect(() => {
+    // Poll only while the push channel is down
+    if (statusLive) return;
+    const interval = setInterval(updateStatus, 2000);
+    return () => clearInterval(interval);
+  }, [statusLive]);
+
   useEffect(() => {
     localStorage.setItem('theme', theme);
   }, [theme]);
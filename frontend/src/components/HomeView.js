@@ -20,8 +20,8 @@ const HomeView = ({ onStatusUpdate, theme, globalLoading, globalLoadingMessage,
 
   const loadPlaylists = async () => {
     try {
-      const data = await musicAPI.getPlaylists();
-      setPlaylists(Object.entries(data.playlists || {}).map(([id, info]) => ({ id, ...info })));
+      const data = await musicAPI.getPlaylistSummaries();
+      setPlaylists(data.playlists || []);
     } catch (error) {
       console.error('Error loading playlists:', error);
     }
@@ -53,6 +53,7 @@ const HomeView = ({ onStatusUpdate, theme, globalLoading, globalLoadingMessage,
         );
         
         const response = await musicAPI.addPlaylist(newUrl);
+        wsRef.current.track(response.job_id);
         if (response.exists) {
           setPopupMessage('Playlist already exists!');
           setShowPopup(true);
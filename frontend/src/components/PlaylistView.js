@@ -129,8 +129,8 @@ const PlaylistView = ({ onStatusUpdate, theme, onPlaylistSelect, onShowOverlay,
   }, []);
 
   const loadPlaylists = async () => { 
-    const response = await musicAPI.getPlaylists(); 
-    setPlaylists(response.playlists); 
+    const response = await musicAPI.getPlaylistSummaries();
+    setPlaylists(Object.fromEntries(response.playlists.map(playlist => [playlist.id, playlist])));
   };
   const selectPlaylist = async (playlistId) => {
     try {
@@ -148,7 +148,7 @@ const PlaylistView = ({ onStatusUpdate, theme, onPlaylistSelect, onShowOverlay,
   const playPlaylist = async (playlistId, e) => {
     e.stopPropagation();
     try {
-      // Preload playlist in background before playing
+      // Warm the songs around the start of the playlist before playing
       musicAPI.preloadPlaylist(playlistId).catch(console.error);
       await musicAPI.play(playlistId, 0);
       onStatusUpdate();
@@ -189,7 +189,8 @@ const PlaylistView = ({ onStatusUpdate, theme, onPlaylistSelect, onShowOverlay,
     );
     
     try {
-      await musicAPI.refreshPlaylist(playlistId);
+      const response = await musicAPI.refreshPlaylist(playlistId);
+      wsRef.current.track(response.job_id);
     } catch (error) {
       console.log('Error refreshing playlist:', error);
       setRefreshingPlaylist(null);
@@ -354,7 +355,7 @@ const PlaylistView = ({ onStatusUpdate, theme, onPlaylistSelect, onShowOverlay,
               <div>
                 <h4 style={{ margin: '0 0 8px', fontSize: '18px', fontWeight: '600', lineHeight: '1.3' }}>{playlist.name}</h4>
                 <p style={{ margin: 0, fontSize: '14px', opacity: 0.7, fontWeight: '500' }}>
-                  {playlist.songs?.length || 0} {playlist.songs?.length === 1 ? 'song' : 'songs'}
+                  {playlist.song_count || 0} {playlist.song_count === 1 ? 'song' : 'songs'}
                 </p>
               </div>
             </div>
@@ -1,22 +1,33 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { musicAPI } from '../services/api';
 
+const PAGE_SIZE = 100;
+
 const SongsView = ({ status, onStatusUpdate, theme }) => {
   const [songs, setSongs] = useState([]);
+  const [totalSongs, setTotalSongs] = useState(0);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [playlistName, setPlaylistName] = useState('');
+  const playlistIdRef = useRef(status?.current_playlist_id);
 
   useEffect(() => {
+    playlistIdRef.current = status?.current_playlist_id;
     loadCurrentPlaylist();
   }, [status?.current_playlist_id]);
 
   const loadCurrentPlaylist = async () => {
     if (status?.current_playlist_id) {
+      const playlistId = status.current_playlist_id;
       try {
-        const response = await musicAPI.getPlaylistSongs(status.current_playlist_id);
+        const response = await musicAPI.getPlaylistSongs(playlistId, { limit: PAGE_SIZE });
+        if (playlistIdRef.current !== playlistId) return;
         setSongs(response.songs);
+        setTotalSongs(response.total);
+        setNextCursor(response.next_cursor);
         
-        const playlists = await musicAPI.getPlaylists();
-        const playlist = playlists.playlists[status.current_playlist_id];
+        const summaries = await musicAPI.getPlaylistSummaries();
+        const playlist = summaries.playlists.find(p => p.id === status.current_playlist_id);
         setPlaylistName(playlist?.name || 'Unknown Playlist');
       } catch (error) {
         console.error('Error loading playlist:', error);
@@ -24,6 +35,36 @@ const SongsView = ({ status, onStatusUpdate, theme }) => {
     }
   };
 
+  const loadMoreSongs = async () => {
+    if (!nextCursor || loadingMore || !status?.current_playlist_id) return;
+    const playlistId = status.current_playlist_id;
+    setLoadingMore(true);
+    try {
+      const response = await musicAPI.getPlaylistSongs(playlistId, { cursor: nextCursor, limit: PAGE_SIZE });
+      // The user switched playlists while this page was in flight
+      if (playlistIdRef.current !== playlistId) return;
+      setSongs(prev => [...prev, ...response.songs]);
+      setTotalSongs(response.total);
+      setNextCursor(response.next_cursor);
+    } catch (error) {
+      if (error.response?.status === 409 && playlistIdRef.current === playlistId) {
+        // The playlist changed since the first page; start over
+        loadCurrentPlaylist();
+      } else {
+        console.error('Error loading more songs:', error);
+      }
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  const handleTracklistScroll = (e) => {
+    const { scrollTop, clientHeight, scrollHeight } = e.currentTarget;
+    if (scrollTop + clientHeight >= scrollHeight - 200) {
+      loadMoreSongs();
+    }
+  };
+
   const playSong = async (songIndex) => {
     if (!status?.current_playlist_id) return;
     try {
@@ -101,10 +142,10 @@ const SongsView = ({ status, onStatusUpdate, theme }) => {
 
       <div>
         <h3 style={{ fontSize: '20px', fontWeight: '600', color: theme === 'dark' ? '#fff' : '#333', marginBottom: '20px' }}>
-          Tracklist ({songs.length} songs)
+          Tracklist ({totalSongs} songs)
         </h3>
         
-        <div style={{ maxHeight: '400px', overflowY: 'auto', paddingTop: '2px' }}>
+        <div style={{ maxHeight: '400px', overflowY: 'auto', paddingTop: '2px' }} onScroll={handleTracklistScroll}>
           {songs.map((song, index) => (
             <div
               key={index}
@@ -66,8 +66,22 @@ export const musicAPI = {
     return response.data;
   },
 
-  async getPlaylistSongs(playlistId) {
-    const response = await api.get(`/playlist/${playlistId}/songs`);
+  async getPlaylistSummaries() {
+    const response = await api.get('/playlists/summary');
+    return response.data;
+  },
+
+  async getPlaylistSongs(playlistId, { cursor, limit } = {}) {
+    const response = await api.get(`/playlist/${playlistId}/songs`, {
+      params: { cursor, limit }
+    });
+    return response.data;
+  },
+
+  async searchSongs(query, { playlistId, offset, limit } = {}) {
+    const response = await api.get('/search', {
+      params: { q: query, playlist_id: playlistId, offset, limit }
+    });
     return response.data;
   },
 
@@ -113,8 +127,6 @@ export const musicAPI = {
       playlist_id: playlistId,
       song_index: 0
     });
-    // Preload songs in background
-    this.preloadPlaylist(playlistId).catch(console.error);
     return response.data;
   },
 
@@ -123,6 +135,16 @@ export const musicAPI = {
     return response.data;
   },
 
+  async getJob(jobId) {
+    const response = await api.get(`/jobs/${jobId}`);
+    return response.data;
+  },
+
+  async cancelJob(jobId) {
+    const response = await api.post(`/jobs/${jobId}/cancel`);
+    return response.data;
+  },
+
   async preloadPlaylist(playlistId) {
     const response = await api.post('/playlist/preload', {
       playlist_id: playlistId,
@@ -147,12 +169,22 @@ export const clearCache = async () => {
   return response.data;
 };
 
-// WebSocket for real-time progress updates
+// WebSocket for real-time progress updates of an import or refresh job
 export class ProgressWebSocket {
   constructor() {
     this.ws = null;
     this.onProgress = null;
     this.onComplete = null;
+    this.jobId = null;
+  }
+
+  // Once the job ID is known, ignore messages of other jobs
+  track(jobId) {
+    this.jobId = jobId || null;
+  }
+
+  isTracked(jobId) {
+    return !this.jobId || !jobId || jobId === this.jobId;
   }
 
   connect(onProgress, onComplete) {
@@ -164,7 +196,18 @@ export class ProgressWebSocket {
     this.ws.onmessage = (event) => {
       const data = JSON.parse(event.data);
       
-      if (data.type === 'progress' && this.onProgress) {
+      if (data.type === 'job') {
+        // Failures and cancellations have no 'complete' message
+        const job = data.job;
+        if (this.isTracked(job.id) && (job.status === 'failed' || job.status === 'cancelled') && this.onComplete) {
+          this.onComplete({
+            status: job.status,
+            message: job.status === 'failed' ? `Failed: ${job.error}` : 'Cancelled'
+          });
+        }
+      } else if (!this.isTracked(data.job_id)) {
+        return;
+      } else if (data.type === 'progress' && this.onProgress) {
         this.onProgress(data);
       } else if (data.type === 'complete' && this.onComplete) {
         this.onComplete(data);
@@ -184,4 +227,75 @@ export class ProgressWebSocket {
   }
 }
 
+// WebSocket for pushed player state: a snapshot, then versioned deltas
+export class PlayerStateSocket {
+  constructor(onState, onConnectionChange) {
+    this.onState = onState;
+    this.onConnectionChange = onConnectionChange;
+    this.ws = null;
+    this.state = null;
+    this.version = null;
+    this.retryDelay = 1000;
+    this.closed = false;
+  }
+
+  connect() {
+    this.closed = false;
+    this.ws = new WebSocket(WS_URL);
+
+    this.ws.onopen = () => {
+      this.retryDelay = 1000;
+      this.resync();
+      if (this.onConnectionChange) this.onConnectionChange(true);
+    };
+
+    this.ws.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      if (data.type === 'snapshot') {
+        this.state = data.state;
+        this.version = data.version;
+        this.onState({ ...this.state, version: this.version });
+      } else if (data.type === 'state') {
+        if (this.state === null || data.base_version !== this.version) {
+          this.resync();  // Missed a delta; ask for what we lack
+          return;
+        }
+        this.state = { ...this.state, ...data.changes };
+        this.version = data.version;
+        this.onState({ ...this.state, version: this.version });
+      }
+    };
+
+    this.ws.onclose = () => {
+      if (this.onConnectionChange) this.onConnectionChange(false);
+      if (!this.closed) {
+        // Reconnect and resync from the last version we saw
+        setTimeout(() => this.connect(), this.retryDelay);
+        this.retryDelay = Math.min(this.retryDelay * 2, 10000);
+      }
+    };
+
+    this.ws.onerror = (error) => {
+      console.error('Player state WebSocket error:', error);
+    };
+  }
+
+  resync() {
+    if (this.ws && this.ws.readyState === WebSocket.OPEN) {
+      this.ws.send(JSON.stringify({
+        type: 'resync',
+        since_version: this.state === null ? null : this.version
+      }));
+    }
+  }
+
+  disconnect() {
+    this.closed = true;
+    if (this.ws) {
+      this.ws.close();
+      this.ws = null;
+    }
+  }
+}
+
 export default api;
\ No newline at end of file